@@ -2,32 +2,31 @@ from functools import wraps
 from django.shortcuts import redirect
 from django.contrib import messages
 
+from .models import Role
+
+
+def capability_required(capability):
+    """Decorator to require a role capability"""
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return redirect('accounts:login')
+            
+            if not request.user.has_capability(capability):
+                messages.error(request, 'You do not have permission to access this page.')
+                return redirect('dashboard:index')
+            
+            return view_func(request, *args, **kwargs)
+        return _wrapped_view
+    return decorator
+
 
 def admin_required(view_func):
     """Decorator to require adviser role"""
-    @wraps(view_func)
-    def _wrapped_view(request, *args, **kwargs):
-        if not request.user.is_authenticated:
-            return redirect('accounts:login')
-        
-        if not request.user.is_adviser and not request.user.is_superuser:
-            messages.error(request, 'You do not have permission to access this page.')
-            return redirect('dashboard:index')
-        
-        return view_func(request, *args, **kwargs)
-    return _wrapped_view
+    return capability_required(Role.MANAGE_USERS)(view_func)
 
 
 def manager_or_admin_required(view_func):
     """Decorator to require president or adviser role"""
-    @wraps(view_func)
-    def _wrapped_view(request, *args, **kwargs):
-        if not request.user.is_authenticated:
-            return redirect('accounts:login')
-        
-        if not (request.user.is_adviser or request.user.is_president or request.user.is_superuser):
-            messages.error(request, 'You do not have permission to access this page.')
-            return redirect('dashboard:index')
-        
-        return view_func(request, *args, **kwargs)
-    return _wrapped_view
+    return capability_required(Role.MANAGE_DOCUMENTS)(view_func)
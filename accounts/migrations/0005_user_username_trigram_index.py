@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+CREATE_USERNAME_TRIGRAM_INDEX = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS accounts_user_username_trgm
+ON accounts_user USING gin (UPPER(username::text) gin_trgm_ops);
+"""
+
+DROP_USERNAME_TRIGRAM_INDEX = """
+DROP INDEX IF EXISTS accounts_user_username_trgm;
+"""
+
+
+def create_username_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_USERNAME_TRIGRAM_INDEX)
+
+
+def drop_username_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_USERNAME_TRIGRAM_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_alter_auditlog_action'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_username_trigram_index, drop_username_trigram_index),
+    ]
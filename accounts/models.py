@@ -69,6 +69,33 @@ class Role(models.Model):
         BSCS_4B_REPRESENTATIVE,
     })
     
+    # Capabilities granted by a role, checked through ``User.has_capability``
+    VIEW_ALL_DOCUMENTS = 'view_all_documents'
+    VIEW_UNRESTRICTED_DOCUMENTS = 'view_unrestricted_documents'
+    MANAGE_DOCUMENTS = 'manage_documents'
+    MANAGE_FOLDERS = 'manage_folders'
+    VIEW_REPORTS = 'view_reports'
+    MANAGE_USERS = 'manage_users'
+
+    ALL_CAPABILITIES = frozenset({
+        VIEW_ALL_DOCUMENTS,
+        VIEW_UNRESTRICTED_DOCUMENTS,
+        MANAGE_DOCUMENTS,
+        MANAGE_FOLDERS,
+        VIEW_REPORTS,
+        MANAGE_USERS,
+    })
+
+    CAPABILITIES = {
+        ADVISER: ALL_CAPABILITIES,
+        PRESIDENT: frozenset({
+            VIEW_UNRESTRICTED_DOCUMENTS,
+            MANAGE_DOCUMENTS,
+            MANAGE_FOLDERS,
+            VIEW_REPORTS,
+        }),
+    }
+    
     name = models.CharField(max_length=50, choices=ROLE_CHOICES, unique=True)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -96,6 +123,30 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
     
+    @property
+    def capabilities(self):
+        """Capabilities granted by the user's role, compiled once per instance.
+
+        The authentication backend loads a fresh user with its role on every
+        request, so a role change is picked up by every worker on the next
+        request. The cache is keyed by role and superuser status, so assigning
+        a new role to a loaded instance invalidates it as well.
+        """
+        key = (self.role_id, self.is_superuser)
+        cached = self.__dict__.get('_capabilities')
+        if cached is None or cached[0] != key:
+            if self.is_superuser:
+                capabilities = Role.ALL_CAPABILITIES
+            elif self.role_id is None:
+                capabilities = frozenset()
+            else:
+                capabilities = Role.CAPABILITIES.get(self.role.name, frozenset())
+            cached = self.__dict__['_capabilities'] = (key, capabilities)
+        return cached[1]
+
+    def has_capability(self, capability):
+        return capability in self.capabilities
+
     @property
     def is_adviser(self):
         return self.role and self.role.name == Role.ADVISER
@@ -137,6 +188,7 @@ class AuditLog(models.Model):
         ('DOCUMENT_UPLOAD', 'Document Upload'),
         ('DOCUMENT_VIEW', 'Document View'),
         ('DOCUMENT_DOWNLOAD', 'Document Download'),
+        ('DOCUMENT_BULK_DOWNLOAD', 'Document Bulk Download'),
         ('DOCUMENT_UPDATE', 'Document Update'),
         ('DOCUMENT_DELETE', 'Document Delete'),
         ('DOCUMENT_ARCHIVE', 'Document Archive'),
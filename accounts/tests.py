@@ -1,5 +1,6 @@
 from django.test import TestCase, Client
 from django.urls import reverse
+from .backends import RoleModelBackend
 from .models import User, Role, AuditLog
 
 
@@ -114,6 +115,49 @@ class RoleBasedAccessTests(TestCase):
         )
         self.assertTrue(unassigned.is_regular_user)
 
+    def test_capabilities_follow_role(self):
+        """Test capabilities are compiled from the role and follow reassignment"""
+        self.assertEqual(self.admin.capabilities, Role.ALL_CAPABILITIES)
+        self.assertTrue(self.manager.has_capability(Role.VIEW_UNRESTRICTED_DOCUMENTS))
+        self.assertFalse(self.manager.has_capability(Role.VIEW_ALL_DOCUMENTS))
+        self.assertFalse(self.manager.has_capability(Role.MANAGE_USERS))
+        self.assertEqual(self.user.capabilities, frozenset())
+
+        self.user.role = self.manager_role
+        self.assertTrue(self.user.has_capability(Role.MANAGE_DOCUMENTS))
+        self.user.role = None
+        self.assertEqual(self.user.capabilities, frozenset())
+
+    def test_authenticated_user_is_loaded_with_role(self):
+        """Test the backend resolves the user and role in a single query"""
+        with self.assertNumQueries(1):
+            user = RoleModelBackend().get_user(self.manager.pk)
+            self.assertTrue(user.is_president)
+            self.assertTrue(user.has_capability(Role.VIEW_REPORTS))
+
+    def test_sessions_from_the_previous_backend_stay_logged_in(self):
+        """Test sessions recorded with ModelBackend still resolve their user"""
+        self.client.force_login(self.manager, backend='django.contrib.auth.backends.ModelBackend')
+        response = self.client.get(reverse('dashboard:index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.user, self.manager)
+
+    def test_role_change_applies_on_next_request(self):
+        """Test a role change is picked up by the user's next request"""
+        officer_client = Client()
+        officer_client.login(username='user', password='pass')
+        response = officer_client.get(reverse('accounts:role_management'))
+        self.assertEqual(response.status_code, 302)
+
+        self.client.login(username='admin', password='pass')
+        self.client.post(reverse('accounts:role_management'), {
+            'user': self.user.pk,
+            'role': self.admin_role.pk,
+        })
+
+        response = officer_client.get(reverse('accounts:role_management'))
+        self.assertEqual(response.status_code, 200)
+
     def test_adviser_can_toggle_user_active(self):
         """Test adviser can deactivate another user"""
         self.client.login(username='admin', password='pass')
@@ -22,7 +22,7 @@ def index(request):
     # Get accessible documents
     accessible_docs = Document.objects.filter(
         get_accessible_documents(user)
-    ).distinct()
+    )
     
     # Total documents count
     total_documents = accessible_docs.count()
@@ -44,7 +44,7 @@ def index(request):
     
     # Recent activity (if adviser or president)
     recent_activity = None
-    if user.is_adviser or user.is_president:
+    if user.has_capability(Role.VIEW_REPORTS):
         recent_activity = AuditLog.objects.select_related('user').order_by('-timestamp')[:10]
 
     school_year_label = get_school_year_label()
@@ -0,0 +1,85 @@
+"""Materialized document access grants.
+
+``DocumentAccess`` holds one row per (user, document) pair granted through
+ownership or sharing. Role-based rules (advisers, presidents and public
+documents) depend only on the user's role and the document's
+classification, so they stay as column predicates and role changes need no
+maintenance here. Rows are kept current by the signals in ``signals.py``;
+``rebuild_document_access`` repairs drift caused by writes that bypass
+signals, such as ``bulk_create`` or ``QuerySet.update``.
+"""
+from django.db.models import Q
+
+from .models import Document, DocumentAccess
+
+
+ACCESS_BATCH_SIZE = 500
+
+
+def _chunks(values, size=ACCESS_BATCH_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _expected_grants(document_ids):
+    grants = set(
+        Document.objects.filter(pk__in=document_ids).values_list('owner_id', 'pk')
+    )
+    grants.update(
+        Document.shared_with.through.objects.filter(
+            document_id__in=document_ids
+        ).values_list('user_id', 'document_id')
+    )
+    return grants
+
+
+def _stored_grants(document_ids):
+    return set(
+        DocumentAccess.objects.filter(
+            document_id__in=document_ids
+        ).values_list('user_id', 'document_id')
+    )
+
+
+def document_access_drift(document_ids=None):
+    """Return ``(missing, extra)`` sets of ``(user_id, document_id)`` grants"""
+    if document_ids is None:
+        document_ids = Document.objects.values_list('pk', flat=True)
+    missing, extra = set(), set()
+    for chunk in _chunks(document_ids):
+        expected = _expected_grants(chunk)
+        stored = _stored_grants(chunk)
+        missing |= expected - stored
+        extra |= stored - expected
+    return missing, extra
+
+
+def sync_document_access(document_ids):
+    """Make the stored grants for ``document_ids`` match ownership and sharing.
+
+    Returns ``(created, deleted)`` row counts.
+    """
+    created = deleted = 0
+    for chunk in _chunks(document_ids):
+        missing, extra = document_access_drift(chunk)
+        if extra:
+            condition = Q()
+            for user_id, document_id in extra:
+                condition |= Q(user_id=user_id, document_id=document_id)
+            deleted += DocumentAccess.objects.filter(condition).delete()[0]
+        if missing:
+            DocumentAccess.objects.bulk_create(
+                [
+                    DocumentAccess(user_id=user_id, document_id=document_id)
+                    for user_id, document_id in missing
+                ],
+                ignore_conflicts=True,
+            )
+            created += len(missing)
+    return created, deleted
+
+
+def rebuild_document_access():
+    """Resynchronize the grants of every document"""
+    return sync_document_access(Document.objects.values_list('pk', flat=True))
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Document, DocumentFolder
+from .models import Blob, Document, DocumentContent, DocumentFolder, DocumentPreview, Tag
 
 
 @admin.register(Document)
@@ -7,7 +7,7 @@ class DocumentAdmin(admin.ModelAdmin):
     list_display = ['title', 'owner', 'classification', 'section', 'category', 'file_size', 'created_at']
     list_filter = ['classification', 'section', 'category', 'created_at']
     search_fields = ['title', 'description', 'owner__username', 'tags']
-    readonly_fields = ['created_at', 'updated_at', 'file_size', 'file_type']
+    readonly_fields = ['created_at', 'updated_at', 'file_name', 'file_size', 'file_type', 'file_hash']
     filter_horizontal = ['shared_with']
     
     fieldsets = (
@@ -18,7 +18,7 @@ class DocumentAdmin(admin.ModelAdmin):
             'fields': ('owner', 'classification', 'section', 'category', 'tags')
         }),
         ('File Information', {
-            'fields': ('file_size', 'file_type')
+            'fields': ('file_name', 'file_size', 'file_type', 'file_hash')
         }),
         ('Access Control', {
             'fields': ('shared_with',)
@@ -30,7 +30,39 @@ class DocumentAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ['sha256', 'extension', 'size', 'encoding', 'ref_count', 'created_at']
+    list_filter = ['encoding']
+    search_fields = ['sha256']
+    readonly_fields = ['sha256', 'extension', 'size', 'encoding', 'ref_count', 'created_at']
+
+
 @admin.register(DocumentFolder)
 class DocumentFolderAdmin(admin.ModelAdmin):
     list_display = ['name', 'key', 'created_at', 'updated_at']
     search_fields = ['name', 'key']
+
+
+@admin.register(DocumentContent)
+class DocumentContentAdmin(admin.ModelAdmin):
+    list_display = ['document', 'file_hash', 'extracted_at']
+    search_fields = ['document__title', 'file_hash']
+    readonly_fields = ['document', 'file_hash', 'content', 'extracted_at']
+
+
+@admin.register(DocumentPreview)
+class DocumentPreviewAdmin(admin.ModelAdmin):
+    list_display = ['document', 'preview_type', 'truncated', 'file_hash', 'generated_at']
+    list_filter = ['preview_type', 'truncated']
+    search_fields = ['document__title', 'file_hash']
+    readonly_fields = [
+        'document', 'file_hash', 'preview_type', 'text', 'rows',
+        'sheet_name', 'truncated', 'error', 'generated_at',
+    ]
+
+
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ['name']
+    search_fields = ['name']
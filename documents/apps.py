@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class DocumentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'documents'
+
+    def ready(self):
+        from django.conf import settings
+        from . import signals  # noqa: F401
+        from .file_serving import check_delivery_mode
+
+        # Refuse to start rather than fail every download
+        check_delivery_mode(settings.FILE_DELIVERY_MODE)
@@ -0,0 +1,150 @@
+"""Preview artifacts stored per file version.
+
+Text, Word and spreadsheet previews are rendered once and stored in
+``DocumentPreview`` keyed by the file's SHA-256, so the detail view reads
+the stored artifact instead of parsing the file. An artifact whose hash no
+longer matches ``Document.file_hash`` is stale and is rendered again.
+PDF previews store the text of the first pages; the pages themselves are
+served one at a time. Other preview types are decided from the file
+extension alone and are not stored. Word, spreadsheet and PDF files are
+parsed in the sandbox pool.
+"""
+from .extraction import FAILED, SKIPPED, TEXT_EXTENSIONS, UNCHANGED, refresh_file_hash
+from .models import DocumentPreview
+from .preview_cache import preview_cache
+from .previews import (
+    PDF_PREVIEW_PAGE_LIMIT,
+    PREVIEW_MAX_FILE_SIZE,
+    PreviewError,
+    load_docx_preview,
+    load_pdf_text,
+    load_spreadsheet_preview,
+    load_text_preview,
+)
+from .sandbox import run_sandboxed
+
+
+STORED_PREVIEW_EXTENSIONS = TEXT_EXTENSIONS + ('.docx', '.xlsx', '.pdf')
+UNREADABLE_PREVIEW_ERROR = (
+    'Preview could not be generated because the file contents could not be read.'
+)
+LIMIT_PREVIEW_ERRORS = {
+    PreviewError.TIMEOUT: 'Preview could not be generated because the file took too long to read.',
+    PreviewError.MEMORY_LIMIT: (
+        'Preview could not be generated because the file needs too much memory to read.'
+    ),
+    PreviewError.CRASHED: (
+        'Preview could not be generated because the file reader stopped unexpectedly.'
+    ),
+}
+BUSY_PREVIEW_ERROR = 'Preview is temporarily unavailable. Please try again shortly.'
+
+RENDERED = 'rendered'
+
+
+def render_preview(file_path, extension):
+    """Return the ``DocumentPreview`` fields for a file.
+
+    Unreadable contents, or contents that hit a sandbox limit, are reported
+    as an ``unsupported`` preview with an error message. ``OSError`` and a
+    ``PreviewError`` for a busy sandbox are left to the caller because they
+    mean the file is temporarily unavailable rather than broken.
+    """
+    fields = {
+        'preview_type': 'text',
+        'text': '',
+        'rows': [],
+        'sheet_name': '',
+        'truncated': False,
+        'error': '',
+    }
+    try:
+        if extension in TEXT_EXTENSIONS:
+            fields['text'], fields['truncated'] = load_text_preview(file_path)
+        elif extension == '.docx':
+            fields['text'], fields['truncated'] = run_sandboxed(load_docx_preview, file_path)
+        elif extension == '.pdf':
+            fields['preview_type'] = 'pdf'
+            fields['text'], fields['truncated'] = run_sandboxed(
+                load_pdf_text, file_path, page_limit=PDF_PREVIEW_PAGE_LIMIT
+            )
+        elif extension == '.xlsx':
+            fields['preview_type'] = 'spreadsheet'
+            fields['sheet_name'], fields['rows'], fields['truncated'] = run_sandboxed(
+                load_spreadsheet_preview, file_path
+            )
+        else:
+            raise ValueError(f'No stored preview for {extension} files')
+    except PreviewError as exc:
+        if exc.reason == PreviewError.BUSY:
+            raise
+        fields.update(
+            preview_type='unsupported',
+            error=LIMIT_PREVIEW_ERRORS.get(exc.reason, UNREADABLE_PREVIEW_ERROR),
+        )
+    return fields
+
+
+def _store_preview(document, file_hash, force=False):
+    file_path = document.file.path
+    extension = document.get_file_extension()
+    # Identical files, such as the same upload on two documents, render once
+    fields = preview_cache.get_or_render(
+        ('render', file_hash, extension),
+        lambda: render_preview(file_path, extension),
+        refresh=force,
+    )
+    preview, _created = DocumentPreview.objects.update_or_create(
+        document=document,
+        defaults={'file_hash': file_hash, **fields},
+    )
+    return preview
+
+
+def build_document_preview(document, force=False):
+    """Render and store the preview of a document's file.
+
+    The file is hashed first, so a preview whose hash matches the file is
+    kept unless ``force`` is set. Returns one of ``RENDERED``,
+    ``UNCHANGED``, ``SKIPPED`` or ``FAILED``.
+    """
+    if (
+        document.get_file_extension() not in STORED_PREVIEW_EXTENSIONS
+        or (document.file_size or document.file.size) > PREVIEW_MAX_FILE_SIZE
+    ):
+        return SKIPPED
+
+    file_hash = refresh_file_hash(document)
+    existing = DocumentPreview.objects.filter(document=document).only('file_hash').first()
+    if existing is not None and existing.file_hash == file_hash and not force:
+        return UNCHANGED
+
+    preview = _store_preview(document, file_hash, force=force)
+    return FAILED if preview.error else RENDERED
+
+
+def get_document_preview(document):
+    """Return the stored preview for the document's current file version.
+
+    ``Document.file_hash`` identifies the version, so a current artifact is
+    served without touching the file. A missing or stale artifact, or one
+    for a document uploaded before hashes were recorded, is rendered and
+    stored on the spot.
+    """
+    preview = DocumentPreview.objects.filter(document=document).first()
+    if preview is not None and document.file_hash and preview.file_hash == document.file_hash:
+        return preview
+
+    file_hash = document.file_hash or refresh_file_hash(document)
+    try:
+        return _store_preview(document, file_hash)
+    except PreviewError as exc:
+        if exc.reason != PreviewError.BUSY:
+            raise
+        # Shown without being stored, so the next view renders it again
+        return DocumentPreview(
+            document=document,
+            file_hash=file_hash,
+            preview_type='unsupported',
+            error=BUSY_PREVIEW_ERROR,
+        )
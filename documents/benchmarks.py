@@ -0,0 +1,376 @@
+"""Synthetic benchmarks for the document repository.
+
+Each scenario seeds its own data inside a transaction that is rolled back
+when the scenario finishes, so benchmarks can be run against a development
+database without leaving rows behind. Run them with
+``python manage.py run_benchmark <scenario>``.
+"""
+import random
+import statistics
+import time
+
+from django.db import connection
+
+from accounts.models import User
+from .models import Document
+
+
+BENCHMARKS = {}
+
+BENCHMARK_WORDS = (
+    'annual', 'budget', 'report', 'minutes', 'meeting', 'policy', 'procedure',
+    'treasurer', 'audit', 'finance', 'event', 'sports', 'festival', 'outreach',
+    'membership', 'election', 'constitution', 'amendment', 'proposal', 'memo',
+    'inventory', 'receipt', 'liquidation', 'calendar', 'schedule', 'seminar',
+)
+
+
+def benchmark(name):
+    """Register a benchmark scenario under ``name``"""
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def time_call(func, repeat):
+    """Run ``func`` ``repeat`` times and return the timings in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def summarize(label, samples):
+    ordered = sorted(samples)
+    p95_index = max(0, int(round(len(ordered) * 0.95)) - 1)
+    return (
+        f'{label:<40} median {statistics.median(ordered):9.2f} ms   '
+        f'min {ordered[0]:9.2f} ms   p95 {ordered[p95_index]:9.2f} ms'
+    )
+
+
+def _random_text(rng, words):
+    return ' '.join(rng.choice(BENCHMARK_WORDS) for _ in range(words))
+
+
+def seed_benchmark_users(count, prefix='bench'):
+    users = [
+        User(username=f'{prefix}_user_{index}', password='!')
+        for index in range(count)
+    ]
+    return User.objects.bulk_create(users)
+
+
+def seed_benchmark_documents(count, owners, rng, batch_size=5000):
+    """Bulk create ``count`` synthetic documents spread across ``owners``"""
+    sections = [value for value, _label in Document.SECTION_CHOICES]
+    classifications = [value for value, _label in Document.CLASSIFICATION_CHOICES]
+    created = 0
+    while created < count:
+        batch = []
+        for index in range(created, min(count, created + batch_size)):
+            batch.append(Document(
+                title=f'{_random_text(rng, 3)} {index}',
+                description=_random_text(rng, 20),
+                file=f'documents/bench/{rng.choice(BENCHMARK_WORDS)}_{index}.pdf',
+                file_type='application/pdf',
+                file_size=rng.randint(1_000, 5_000_000),
+                owner=rng.choice(owners),
+                classification=rng.choice(classifications),
+                section=rng.choice(sections),
+                category=rng.choice(BENCHMARK_WORDS).title(),
+                tags=', '.join(rng.sample(BENCHMARK_WORDS, 3)),
+            ))
+        Document.objects.bulk_create(batch)
+        created += len(batch)
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE documents_document')
+
+
+@benchmark('search')
+def search_benchmark(stdout, documents=100_000, repeat=20, seed=42):
+    """Compare the search engine against the legacy ILIKE filter"""
+    from django.db.models import Q
+    from .search import search_documents
+
+    rng = random.Random(seed)
+    owners = seed_benchmark_users(20, prefix='search_bench')
+    seed_benchmark_documents(documents, owners, rng)
+    base = Document.objects.filter(is_archived=False)
+
+    queries = ['budget', 'annual report', '"treasurer audit"', 'fest*']
+    stdout.write(f'Search benchmark on {connection.vendor} with {documents} documents')
+    for query in queries:
+        def run_engine():
+            results, ranked = search_documents(base, query)
+            if ranked:
+                results = results.order_by('-search_rank', '-created_at', 'id')
+            list(results[:25])
+
+        def run_legacy():
+            list(base.filter(
+                Q(title__icontains=query) |
+                Q(description__icontains=query) |
+                Q(file__icontains=query)
+            ).order_by('-created_at')[:25])
+
+        stdout.write(summarize(f'engine  {query!r}', time_call(run_engine, repeat)))
+        stdout.write(summarize(f'legacy  {query!r}', time_call(run_legacy, repeat)))
+
+
+@benchmark('access')
+def access_benchmark(stdout, documents=50_000, repeat=20, seed=42):
+    """Compare the access-grant filter against the legacy JOIN + DISTINCT filter"""
+    from django.db.models import Q
+    from .access import sync_document_access
+    from .permissions import get_accessible_documents
+
+    rng = random.Random(seed)
+    owners = seed_benchmark_users(50, prefix='access_bench')
+    seed_benchmark_documents(documents, owners, rng)
+
+    # Heavy sharing: every document is shared with up to ten users
+    through = Document.shared_with.through
+    document_ids = list(Document.objects.filter(owner__in=owners).values_list('pk', flat=True))
+    shares = [
+        through(document_id=document_id, user_id=user.pk)
+        for document_id in document_ids
+        for user in rng.sample(owners, rng.randint(1, 10))
+    ]
+    through.objects.bulk_create(shares, batch_size=5000)
+    # bulk_create skips the signals that maintain the access grants
+    sync_document_access(document_ids)
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {through._meta.db_table}')
+            cursor.execute('ANALYZE documents_documentaccess')
+
+    user = owners[0]
+    legacy_filter = Q(owner=user) | Q(shared_with=user) | Q(classification='PUBLIC')
+    granted = Document.objects.filter(get_accessible_documents(user), is_archived=False)
+    legacy = Document.objects.filter(legacy_filter, is_archived=False).distinct()
+
+    stdout.write(
+        f'Access benchmark on {connection.vendor} with {documents} documents '
+        f'and {len(shares)} shares'
+    )
+    cases = (
+        ('count', lambda queryset: queryset.count()),
+        ('first page', lambda queryset: list(queryset.order_by('-created_at', 'id')[:25])),
+    )
+    for label, run in cases:
+        stdout.write(summarize(f'grants  {label}', time_call(lambda: run(granted), repeat)))
+        stdout.write(summarize(f'legacy  {label}', time_call(lambda: run(legacy), repeat)))
+
+
+@benchmark('docx')
+def docx_benchmark(stdout, documents=20_000, repeat=20, seed=42):
+    """Compare the streaming .docx reader against loading it with python-docx
+
+    ``documents`` is the number of paragraphs in the generated Word file.
+    """
+    import os
+    import tempfile
+    from docx import Document as DocxDocument
+    from .previews import PREVIEW_CHAR_LIMIT, _truncate_text, load_docx_preview
+
+    rng = random.Random(seed)
+    doc = DocxDocument()
+    for _ in range(documents):
+        doc.add_paragraph(_random_text(rng, rng.randint(5, 40)))
+
+    def run_legacy(path, limit):
+        paragraphs = [paragraph.text for paragraph in DocxDocument(path).paragraphs if paragraph.text]
+        _truncate_text('\n'.join(paragraphs), limit)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'benchmark.docx')
+        doc.save(path)
+        stdout.write(
+            f'Word preview benchmark with {documents} paragraphs '
+            f'({os.path.getsize(path)} bytes)'
+        )
+        for label, limit in (('preview', PREVIEW_CHAR_LIMIT), ('full text', None)):
+            stdout.write(summarize(
+                f'stream  {label}', time_call(lambda: load_docx_preview(path, limit=limit), repeat)
+            ))
+            stdout.write(summarize(
+                f'legacy  {label}', time_call(lambda: run_legacy(path, limit), repeat)
+            ))
+
+
+@benchmark('delivery')
+def delivery_benchmark(stdout, documents=10, repeat=20, seed=42):
+    """Compare how long a download occupies the web worker per delivery mode
+
+    ``documents`` is the size of the downloaded file in megabytes. The
+    timing covers the view and draining its response, which is the time a
+    WSGI worker is held; in the offload modes the proxy sends the bytes.
+    """
+    import os
+    import tempfile
+    from django.core.files.base import ContentFile
+    from django.test import Client, override_settings
+    from django.urls import reverse
+    from .file_serving import DELIVERY_MODES
+
+    rng = random.Random(seed)
+    owner, = seed_benchmark_users(1, prefix='delivery_bench')
+    client = Client()
+    client.force_login(owner)
+
+    def run(document):
+        response = client.get(reverse('documents:document_download', args=[document.pk]))
+        if response.streaming:
+            for _chunk in response.streaming_content:
+                pass
+
+    with (
+        tempfile.TemporaryDirectory() as media_root,
+        override_settings(MEDIA_ROOT=media_root, ALLOWED_HOSTS=['testserver']),
+    ):
+        document = Document(
+            title='Delivery benchmark',
+            owner=owner,
+            classification='PUBLIC',
+            file_type='application/pdf',
+        )
+        content = rng.randbytes(documents * 1024 * 1024)
+        document.file.save('delivery_benchmark.pdf', ContentFile(content), save=False)
+        document.file_size = len(content)
+        document.save()
+        stdout.write(f'Delivery benchmark with a {os.path.getsize(document.file.path)} byte file')
+        for mode in DELIVERY_MODES:
+            with override_settings(FILE_DELIVERY_MODE=mode):
+                stdout.write(summarize(f'{mode}  download', time_call(lambda: run(document), repeat)))
+
+
+@benchmark('compression')
+def compression_benchmark(stdout, documents=10, repeat=20, seed=42):
+    """Compare storing and downloading a text file as-is and compressed
+
+    ``documents`` is the size of the text file in megabytes. Compressed
+    files are downloaded by a client that accepts the encoding, which gets
+    the stored bytes, and by one that does not, which gets them
+    decompressed as they stream.
+    """
+    import os
+    import tempfile
+    from django.core.files.base import ContentFile
+    from django.test import Client, override_settings
+    from django.urls import reverse
+    from .compression import GZIP, ZSTD
+
+    rng = random.Random(seed)
+    owner, = seed_benchmark_users(1, prefix='compression_bench')
+    client = Client()
+    client.force_login(owner)
+    lines = [_random_text(rng, rng.randint(5, 15)) for _ in range(2000)]
+    content = '\n'.join(rng.choice(lines) for _ in range(documents * 12000)).encode()
+    content = content[:documents * 1024 * 1024]
+
+    def run(document, accept_encoding=''):
+        response = client.get(
+            reverse('documents:document_download', args=[document.pk]),
+            HTTP_ACCEPT_ENCODING=accept_encoding,
+        )
+        for _chunk in response.streaming_content:
+            pass
+
+    encodings = ['']
+    try:
+        import zstandard  # noqa: F401
+        encodings += [GZIP, ZSTD]
+    except ImportError:
+        encodings += [GZIP]
+        stdout.write('zstandard is not installed; skipping zstd')
+
+    with (
+        tempfile.TemporaryDirectory() as media_root,
+        override_settings(MEDIA_ROOT=media_root, ALLOWED_HOSTS=['testserver']),
+    ):
+        stdout.write(f'Compression benchmark with a {len(content)} byte text file')
+        for index, encoding in enumerate(encodings):
+            label = encoding or 'none'
+            compression = {'text/plain': encoding} if encoding else {}
+            # Identical content would be deduplicated into the first blob
+            text = f'{label}\n'.encode() + content
+            with override_settings(DOCUMENT_COMPRESSION=compression):
+                started = time.perf_counter()
+                document = Document.objects.create(
+                    title=f'Compression benchmark {label}',
+                    owner=owner,
+                    classification='PUBLIC',
+                    file=ContentFile(text, name=f'compression_benchmark_{index}.txt'),
+                    file_type='text/plain',
+                    file_size=len(text),
+                )
+                elapsed = (time.perf_counter() - started) * 1000
+            stored = os.path.getsize(document.file.path)
+            stdout.write(
+                f'{label:<6} stored in {stored:>10} bytes ({stored / len(text):6.1%}) '
+                f'in {elapsed:9.2f} ms'
+            )
+            stdout.write(summarize(f'{label:<6} download', time_call(lambda: run(document), repeat)))
+            if encoding:
+                stdout.write(summarize(
+                    f'{label:<6} download, passed through',
+                    time_call(lambda: run(document, encoding), repeat),
+                ))
+
+
+@benchmark('bulk_download')
+def bulk_download_benchmark(stdout, documents=20, repeat=20, seed=42):
+    """Time a folder ZIP download and track the memory it allocates
+
+    ``documents`` 1MB files, half of them text, are archived per run.
+    Streaming keeps the peak allocation near one chunk however many
+    files the archive holds.
+    """
+    import tempfile
+    import tracemalloc
+    from django.core.files.base import ContentFile
+    from django.test import Client, override_settings
+    from django.urls import reverse
+
+    rng = random.Random(seed)
+    owner, = seed_benchmark_users(1, prefix='bulk_bench')
+    client = Client()
+    client.force_login(owner)
+    url = reverse('documents:document_bulk_download')
+
+    def run():
+        response = client.get(url, {'folder': 'REPORTS'})
+        for _chunk in response.streaming_content:
+            pass
+
+    with (
+        tempfile.TemporaryDirectory() as media_root,
+        override_settings(MEDIA_ROOT=media_root, ALLOWED_HOSTS=['testserver']),
+    ):
+        for index in range(documents):
+            if index % 2:
+                content = '\n'.join(_random_text(rng, 12) for _ in range(12000)).encode()
+                name, file_type = f'bulk_{index}.txt', 'text/plain'
+            else:
+                content = b'%PDF-1.4\n' + rng.randbytes(1024 * 1024)
+                name, file_type = f'bulk_{index}.pdf', 'application/pdf'
+            Document.objects.create(
+                title=f'Bulk benchmark {index}',
+                owner=owner,
+                classification='PUBLIC',
+                section='REPORTS',
+                file=ContentFile(content[:1024 * 1024], name=name),
+                file_type=file_type,
+                file_size=min(len(content), 1024 * 1024),
+            )
+        stdout.write(summarize(f'zip of {documents} documents', time_call(run, repeat)))
+        tracemalloc.start()
+        run()
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stdout.write(f'peak allocation during one download: {peak / 1024:.0f} KB')
@@ -0,0 +1,103 @@
+"""Content-addressed, deduplicated storage for uploaded document files.
+
+An uploaded file is stored once under the SHA-256 of its content, at
+``blobs/<2 hex>/<2 hex>/<sha256><extension>``, and every document with the
+same content points at the same ``Blob`` whatever it was uploaded as. Each
+blob counts the documents that reference it and its file is deleted once
+the count drops to zero. The hash is usually computed while the upload
+streams in (see ``uploads.py``), so storing a duplicate costs no extra
+read of the file. Types listed in ``DOCUMENT_COMPRESSION`` are stored
+compressed (see ``compression.py``).
+
+Reference counts are maintained by the signals in ``signals.py``;
+``migrate_document_blobs`` moves files saved under the old per-user paths
+into blobs and recounts references after writes that bypass signals.
+"""
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+
+from .compression import compress, encoding_for
+from .models import Blob
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+MAX_EXTENSION_LENGTH = 10
+
+
+def content_sha256(content):
+    """Return the hex SHA-256 of a Django ``File``, reading it in chunks"""
+    digest = hashlib.sha256()
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def store_blob(content, content_type=''):
+    """Store ``content`` unless a blob with the same hash exists, take a
+    reference to it and return the blob.
+
+    Uses the digest the upload handler attached as ``content.sha256`` when
+    there is one, so the file is not read twice. ``content_type`` picks the
+    compression for a new blob.
+    """
+    sha256 = getattr(content, 'sha256', None) or content_sha256(content)
+    extension = os.path.splitext(content.name or '')[1].lower()
+    if len(extension) > MAX_EXTENSION_LENGTH:
+        extension = ''
+    with transaction.atomic():
+        # The row lock serializes this with release_blob deleting the file
+        blob, created = Blob.objects.select_for_update().get_or_create(
+            sha256=sha256,
+            defaults={'size': content.size, 'extension': extension},
+        )
+        if created or not default_storage.exists(blob.name):
+            compressed = None
+            if created:
+                encoding = encoding_for(content_type or getattr(content, 'content_type', ''))
+                compressed = compress(content, encoding) if encoding else None
+                if compressed is not None:
+                    blob.encoding = encoding
+                    blob.save(update_fields=['encoding'])
+            elif blob.encoding:
+                # Put the file back in the encoding its name records
+                compressed = compress(content, blob.encoding, min_savings=None)
+            # A file left behind by an interrupted store may be incomplete
+            default_storage.delete(blob.name)
+            if compressed is None:
+                default_storage.save(blob.name, content)
+            else:
+                with compressed:
+                    default_storage.save(blob.name, File(compressed))
+        Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+    blob.ref_count += 1
+    return blob
+
+
+def discard_blob_file(sha256, name):
+    """Delete a blob file written in a transaction that was rolled back,
+    unless a blob row that existed before still owns it"""
+    if not Blob.objects.filter(sha256=sha256).exists():
+        default_storage.delete(name)
+
+
+def release_blob(blob_id):
+    """Drop a reference to a blob, deleting it once nothing refers to it"""
+    Blob.objects.filter(pk=blob_id, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+    transaction.on_commit(lambda: delete_unreferenced_blob(blob_id))
+
+
+def delete_unreferenced_blob(blob_id):
+    """Delete a blob and its file if its reference count is zero"""
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(pk=blob_id, ref_count=0).first()
+        if blob is None or blob.documents.exists():
+            return False
+        blob.delete()
+        default_storage.delete(blob.name)
+    return True
@@ -0,0 +1,120 @@
+"""Compression at rest for document types that compress well.
+
+``DOCUMENT_COMPRESSION`` maps content types to an encoding, ``gzip`` or
+``zstd`` (the latter needs the ``zstandard`` package). A blob of a listed
+type is stored compressed, under its usual name plus ``.gz`` or ``.zst``,
+unless that saves less than ``MIN_SAVINGS``. Only types no reader needs
+random access to may be listed: plain text and the legacy OLE Word and
+Excel formats.
+
+The suffix is the only record of the encoding a reader needs, so anything
+given a stored file's path opens it with ``open_stored`` and reads the
+original bytes, in this process or a sandbox worker alike. Downloads pass
+the compressed bytes through when the client accepts the encoding (see
+``file_serving.py``); ``compress_document_blobs`` compresses blobs stored
+before the setting was enabled.
+"""
+import gzip
+import os
+import struct
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+SUFFIXES = {GZIP: '.gz', ZSTD: '.zst'}
+COMPRESSIBLE_TYPES = (
+    'text/plain',
+    'application/msword',
+    'application/vnd.ms-excel',
+)
+# Compressed copies saving less than this fraction are not kept
+MIN_SAVINGS = 0.1
+COMPRESS_CHUNK_SIZE = 1024 * 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+ZSTD_FRAME_HEADER_MAX = 18  # bytes
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError as exc:
+        raise ImproperlyConfigured('zstd compression needs the zstandard package.') from exc
+    return zstandard
+
+
+def encoding_for(content_type):
+    """Return the encoding to store ``content_type`` files with, or ''"""
+    encoding = settings.DOCUMENT_COMPRESSION.get(content_type or '', '')
+    if encoding and (encoding not in SUFFIXES or content_type not in COMPRESSIBLE_TYPES):
+        raise ImproperlyConfigured(
+            f'DOCUMENT_COMPRESSION cannot store {content_type} as {encoding!r}: encodings are '
+            f'{", ".join(SUFFIXES)} and types {", ".join(COMPRESSIBLE_TYPES)}.'
+        )
+    return encoding
+
+
+def path_encoding(path):
+    """Return the encoding a stored file's name says it is in, or ''"""
+    for encoding, suffix in SUFFIXES.items():
+        if path.endswith(suffix):
+            return encoding
+    return ''
+
+
+def compress(content, encoding, min_savings=MIN_SAVINGS):
+    """Compress a Django ``File`` into a rewound temporary file.
+
+    Returns None when the compressed copy would save less than the
+    ``min_savings`` fraction of the size; the caller then stores
+    ``content`` as it is. ``min_savings=None`` always compresses.
+    """
+    compressed = tempfile.TemporaryFile()
+    if encoding == GZIP:
+        # A fixed mtime keeps the output a function of the content alone
+        writer = gzip.GzipFile(fileobj=compressed, mode='wb', compresslevel=GZIP_LEVEL, mtime=0)
+    else:
+        writer = _zstandard().ZstdCompressor(level=ZSTD_LEVEL).stream_writer(
+            compressed, size=content.size, closefd=False
+        )
+    with writer:
+        for chunk in content.chunks(COMPRESS_CHUNK_SIZE):
+            writer.write(chunk)
+    content.seek(0)
+    if min_savings is not None and compressed.tell() > content.size * (1 - min_savings):
+        compressed.close()
+        return None
+    compressed.seek(0)
+    return compressed
+
+
+def open_stored(path):
+    """Open a stored file for binary reading, decompressing it if its name
+    says it is compressed"""
+    encoding = path_encoding(path)
+    if encoding == GZIP:
+        return gzip.open(path, 'rb')
+    if encoding == ZSTD:
+        return _zstandard().ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, 'rb')
+
+
+def original_size(path):
+    """Return the decompressed size of a stored file, or None if unknown"""
+    encoding = path_encoding(path)
+    if encoding == GZIP:
+        # The trailer holds the size modulo 4GB, well above the upload limit
+        with open(path, 'rb') as file:
+            file.seek(-4, os.SEEK_END)
+            return struct.unpack('<I', file.read(4))[0]
+    if encoding == ZSTD:
+        zstandard = _zstandard()
+        with open(path, 'rb') as file:
+            size = zstandard.frame_content_size(file.read(ZSTD_FRAME_HEADER_MAX))
+        return size if size >= 0 else None
+    return os.path.getsize(path)
+
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import re
+
+from .compression import open_stored
+from .models import DocumentContent
+from .previews import (
+    PreviewError,
+    load_docx_preview,
+    load_pdf_text,
+    load_spreadsheet_text,
+    load_text_preview,
+)
+from .sandbox import run_sandboxed
+
+
+# PostgreSQL rejects tsvectors larger than 1 MB, so very large files are
+# indexed up to this many characters.
+CONTENT_CHAR_LIMIT = 500_000
+HASH_CHUNK_SIZE = 1024 * 1024
+TEXT_EXTENSIONS = ('.txt', '.csv', '.log')
+EXTRACTABLE_EXTENSIONS = TEXT_EXTENSIONS + ('.docx', '.xlsx', '.pdf')
+UNSAFE_CONTROL_CHAR_PATTERN = re.compile(r'[\x00-\x08\x0B-\x1F\x7F]')
+
+EXTRACTED = 'extracted'
+UNCHANGED = 'unchanged'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+
+def file_sha256(file_path):
+    """Return the hex SHA-256 digest of a file's content, read in chunks"""
+    digest = hashlib.sha256()
+    with open_stored(file_path) as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def refresh_file_hash(document):
+    """Hash the document's file and record the digest if it changed"""
+    file_hash = file_sha256(document.file.path)
+    if document.file_hash != file_hash:
+        document.file_hash = file_hash
+        document.save(update_fields=['file_hash'])
+    return file_hash
+
+
+def extract_text(file_path, extension):
+    """Return the full text of a supported file using the preview readers.
+
+    Word, spreadsheet and PDF files are parsed in the sandbox pool.
+    """
+    if extension in TEXT_EXTENSIONS:
+        text, _truncated = load_text_preview(file_path, limit=CONTENT_CHAR_LIMIT)
+    elif extension == '.docx':
+        text, _truncated = run_sandboxed(
+            load_docx_preview,
+            file_path,
+            limit=CONTENT_CHAR_LIMIT,
+            include_tables=True,
+            include_headers=True,
+            include_notes=True,
+        )
+    elif extension == '.pdf':
+        text, _truncated = run_sandboxed(load_pdf_text, file_path, limit=CONTENT_CHAR_LIMIT)
+    elif extension == '.xlsx':
+        text, _truncated = run_sandboxed(load_spreadsheet_text, file_path, limit=CONTENT_CHAR_LIMIT)
+    else:
+        return ''
+    return UNSAFE_CONTROL_CHAR_PATTERN.sub(' ', text)
+
+
+def extract_document_content(document, force=False):
+    """Extract and store the searchable text of a document's file.
+
+    Extraction is keyed on the file's SHA-256, so a file whose hash matches
+    the stored content is not parsed again unless ``force`` is set. Returns
+    one of ``EXTRACTED``, ``UNCHANGED``, ``SKIPPED`` or ``FAILED``.
+    """
+    extension = document.get_file_extension()
+    if extension not in EXTRACTABLE_EXTENSIONS or not os.path.exists(document.file.path):
+        return SKIPPED
+
+    file_hash = refresh_file_hash(document)
+
+    existing = DocumentContent.objects.filter(document=document).only('file_hash').first()
+    if existing is not None and existing.file_hash == file_hash and not force:
+        return UNCHANGED
+
+    status = EXTRACTED
+    try:
+        text = extract_text(document.file.path, extension)
+    except PreviewError as exc:
+        if exc.reason == PreviewError.BUSY:
+            # Nothing is wrong with the file; let the caller try again later
+            raise
+        # Unreadable files, and files that hit a sandbox limit, are recorded
+        # with empty content so they are not re-parsed until the file changes.
+        text = ''
+        status = FAILED
+
+    DocumentContent.objects.update_or_create(
+        document=document,
+        defaults={'file_hash': file_hash, 'content': text},
+    )
+    return status
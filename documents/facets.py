@@ -0,0 +1,63 @@
+"""Facet counts for document search results.
+
+All facets are counted in one statement over the filtered, access-checked
+queryset. PostgreSQL groups once with ``GROUPING SETS``; other databases run
+one ``GROUP BY`` per facet over a shared CTE joined with ``UNION ALL``.
+"""
+from django.db import connection
+from django.db.models import F
+
+
+DOCUMENT_FACETS = ('section', 'classification', 'owner__username', 'category')
+
+
+def _facet_source(documents, fields):
+    aliases = [f'facet_{index}' for index in range(len(fields))]
+    source = documents.order_by().annotate(
+        **{alias: F(field) for alias, field in zip(aliases, fields)}
+    ).values('pk', *aliases)
+    sql, params = source.query.sql_with_params()
+    return aliases, sql, params
+
+
+def _facet_sql(aliases, source_sql):
+    if connection.vendor == 'postgresql':
+        columns = ', '.join(aliases)
+        grouping = ', '.join(f'GROUPING({alias})' for alias in aliases)
+        sets = ', '.join(f'({alias})' for alias in aliases)
+        return (
+            f'WITH facet_source AS ({source_sql}) '
+            f'SELECT {columns}, {grouping}, COUNT(*) FROM facet_source '
+            f'GROUP BY GROUPING SETS ({sets})'
+        )
+    selects = ' UNION ALL '.join(
+        f'SELECT {index}, {alias}, COUNT(*) FROM facet_source GROUP BY {alias}'
+        for index, alias in enumerate(aliases)
+    )
+    return f'WITH facet_source AS ({source_sql}) {selects}'
+
+
+def facet_counts(documents, fields=DOCUMENT_FACETS):
+    """Return ``{field: {value: count}}`` for a document queryset.
+
+    ``documents`` should already be filtered by ``get_accessible_documents``
+    and the search form, so the counts only cover documents the user can see.
+    """
+    counts = {field: {} for field in fields}
+    if not fields:
+        return counts
+    aliases, source_sql, params = _facet_source(documents, fields)
+    with connection.cursor() as cursor:
+        cursor.execute(_facet_sql(aliases, source_sql), params)
+        rows = cursor.fetchall()
+
+    if connection.vendor == 'postgresql':
+        width = len(fields)
+        for row in rows:
+            values, grouping, total = row[:width], row[width:-1], row[-1]
+            index = list(grouping).index(0)
+            counts[fields[index]][values[index]] = total
+    else:
+        for index, value, total in rows:
+            counts[fields[index]][value] = total
+    return counts
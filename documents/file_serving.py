@@ -0,0 +1,287 @@
+"""Serve stored files with validators, conditional GET and byte ranges.
+
+Responses carry a strong ``ETag`` (the file's SHA-256) and
+``Last-Modified`` (its mtime), answer ``If-None-Match`` and friends with
+``304``/``412``, and honour ``Range`` with ``206 Partial Content`` for one
+range or a ``multipart/byteranges`` body for several. ``If-Range`` makes a
+range request fall back to the full file when the client's copy is stale.
+Callers run their permission and archive checks before calling
+``serve_file``; nothing is read from disk until then.
+
+With ``FILE_DELIVERY_MODE`` set to ``x-accel-redirect`` or ``x-sendfile``
+the bytes are not sent from Python at all: the response carries an
+internal-redirect header and the front proxy (nginx, or Apache/lighttpd)
+serves the file from a location clients cannot request directly, handling
+ranges itself. Conditional requests are still answered here, so a ``304``
+never reaches the proxy.
+
+Files stored compressed (see ``compression.py``) are always sent from
+Python: as stored, with ``Content-Encoding`` and a tag of their own, when
+the client accepts the encoding, and decompressed as they stream
+otherwise. Ranges of compressed files are not served.
+"""
+import mimetypes
+import os
+import secrets
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+from .compression import SUFFIXES, open_stored, original_size, path_encoding
+
+
+DELIVERY_DJANGO = 'django'
+DELIVERY_X_ACCEL_REDIRECT = 'x-accel-redirect'
+DELIVERY_X_SENDFILE = 'x-sendfile'
+DELIVERY_MODES = (DELIVERY_DJANGO, DELIVERY_X_ACCEL_REDIRECT, DELIVERY_X_SENDFILE)
+
+RANGE_CHUNK_SIZE = 64 * 1024
+# More ranges than this are served as the full file rather than split up
+MAX_RANGES = 16
+
+
+def parse_range_header(header, size):
+    """Parse a ``Range`` header for a file of ``size`` bytes.
+
+    Returns a sorted list of inclusive ``(start, end)`` byte ranges with
+    overlapping and adjacent ranges merged, an empty list when no range is
+    satisfiable, or None when the header is invalid or unsupported and
+    should be ignored.
+    """
+    units, _, specs = header.partition('=')
+    if units.strip().lower() != 'bytes' or not specs.strip():
+        return None
+    specs = specs.split(',')
+    if len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        start, separator, end = spec.strip().partition('-')
+        start, end = start.strip(), end.strip()
+        if not separator or not (start or end):
+            return None
+        if (start and not start.isdigit()) or (end and not end.isdigit()):
+            return None
+        if not start:
+            # Suffix range: the last ``end`` bytes
+            length = int(end)
+            if length and size:
+                ranges.append((max(0, size - length), size - 1))
+            continue
+        first = int(start)
+        if end and int(end) < first:
+            return None
+        last = int(end) if end else size - 1
+        if first < size:
+            ranges.append((first, min(last, size - 1)))
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _if_range_matches(if_range, etag, last_modified):
+    if if_range.startswith(('"', 'W/')):
+        # If-Range only matches strong validators
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _read_ranges(file_path, ranges, boundary=None, content_type=None, size=None):
+    with open(file_path, 'rb') as file:
+        for start, end in ranges:
+            if boundary:
+                yield _part_header(boundary, content_type, start, end, size)
+            file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = file.read(min(RANGE_CHUNK_SIZE, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+            if boundary:
+                yield b'\r\n'
+        if boundary:
+            yield f'--{boundary}--\r\n'.encode()
+
+
+def _part_header(boundary, content_type, start, end, size):
+    return (
+        f'--{boundary}\r\n'
+        f'Content-Type: {content_type}\r\n'
+        f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+    ).encode()
+
+
+def _accepts_encoding(request, encoding):
+    """Whether the request's ``Accept-Encoding`` allows ``encoding``"""
+    qualities = {}
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        coding, *params = item.split(';')
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    if encoding == 'gzip' and 'x-gzip' in qualities:
+        qualities.setdefault('gzip', qualities['x-gzip'])
+    # A coding named explicitly overrides the wildcard
+    return qualities.get(encoding, qualities.get('*', 0.0)) > 0
+
+
+def _read_stored(file_path):
+    with open_stored(file_path) as file:
+        for chunk in iter(lambda: file.read(RANGE_CHUNK_SIZE), b''):
+            yield chunk
+
+
+def _serve_compressed(request, file_path, encoding, etag, last_modified, content_type,
+                      as_attachment, filename):
+    passthrough = _accepts_encoding(request, encoding)
+    if passthrough:
+        # The encoded bytes are a different representation with their own tag
+        etag = f'{etag[:-1]}-{encoding}"'
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None and passthrough:
+        response = FileResponse(
+            open(file_path, 'rb'),
+            content_type=content_type,
+            as_attachment=as_attachment,
+            filename=filename,
+        )
+        response['Content-Encoding'] = encoding
+    elif response is None:
+        response = StreamingHttpResponse(_read_stored(file_path), content_type=content_type)
+        size = original_size(file_path)
+        if size is not None:
+            response['Content-Length'] = str(size)
+        disposition = content_disposition_header(
+            as_attachment, filename or os.path.basename(file_path.removesuffix(SUFFIXES[encoding]))
+        )
+        if disposition:
+            response['Content-Disposition'] = disposition
+
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'none'
+    return response
+
+
+def check_delivery_mode(mode):
+    """Raise ImproperlyConfigured unless ``mode`` is a known delivery mode"""
+    if mode not in DELIVERY_MODES:
+        raise ImproperlyConfigured(
+            f'FILE_DELIVERY_MODE must be one of {", ".join(DELIVERY_MODES)}, not {mode!r}.'
+        )
+
+
+def _offload_response(mode, file_path, content_type, as_attachment, filename):
+    """Return an empty response telling the front proxy to send ``file_path``,
+    or None when the file is outside ``MEDIA_ROOT`` and must be streamed"""
+    check_delivery_mode(mode)
+    media_root = os.path.abspath(settings.MEDIA_ROOT)
+    file_path = os.path.abspath(file_path)
+    relative_path = os.path.relpath(file_path, media_root)
+    if relative_path.startswith(os.pardir):
+        return None
+
+    response = HttpResponse(content_type=content_type)
+    if mode == DELIVERY_X_ACCEL_REDIRECT:
+        prefix = settings.FILE_DELIVERY_ACCEL_PREFIX.rstrip('/')
+        response['X-Accel-Redirect'] = f'{prefix}/{quote(relative_path.replace(os.sep, "/"))}'
+    else:
+        response['X-Sendfile'] = file_path
+    disposition = content_disposition_header(as_attachment, filename or os.path.basename(file_path))
+    if disposition:
+        response['Content-Disposition'] = disposition
+    return response
+
+
+def serve_file(request, file_path, etag, content_type=None, as_attachment=False, filename=''):
+    """Return a response serving ``file_path`` that honours validators and ranges.
+
+    ``etag`` is the quoted strong entity tag of the file's current content.
+    """
+    stat = os.stat(file_path)
+    size = stat.st_size
+    last_modified = int(stat.st_mtime)
+    encoding = path_encoding(file_path)
+    if not content_type:
+        content_type = mimetypes.guess_type(
+            filename or file_path.removesuffix(SUFFIXES.get(encoding, ''))
+        )[0] or 'application/octet-stream'
+    if encoding:
+        return _serve_compressed(
+            request, file_path, encoding, etag, last_modified, content_type, as_attachment, filename
+        )
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    mode = settings.FILE_DELIVERY_MODE
+    if response is None and mode != DELIVERY_DJANGO:
+        response = _offload_response(mode, file_path, content_type, as_attachment, filename)
+
+    if response is None:
+        ranges = None
+        range_header = request.headers.get('Range')
+        if range_header and request.method in ('GET', 'HEAD'):
+            if_range = request.headers.get('If-Range')
+            if not if_range or _if_range_matches(if_range, etag, last_modified):
+                ranges = parse_range_header(range_header, size)
+
+        if ranges is None:
+            response = FileResponse(
+                open(file_path, 'rb'),
+                content_type=content_type,
+                as_attachment=as_attachment,
+                filename=filename,
+            )
+        elif not ranges:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            response = StreamingHttpResponse(
+                _read_ranges(file_path, ranges), status=206, content_type=content_type
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(end - start + 1)
+        else:
+            boundary = secrets.token_hex(16)
+            length = sum(
+                len(_part_header(boundary, content_type, start, end, size)) + end - start + 1 + 2
+                for start, end in ranges
+            ) + len(f'--{boundary}--\r\n')
+            response = StreamingHttpResponse(
+                _read_ranges(file_path, ranges, boundary, content_type, size),
+                status=206,
+                content_type=f'multipart/byteranges; boundary={boundary}',
+            )
+            response['Content-Length'] = str(length)
+
+        if response.status_code == 206:
+            disposition = content_disposition_header(
+                as_attachment, filename or os.path.basename(file_path)
+            )
+            if disposition:
+                response['Content-Disposition'] = disposition
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -102,8 +102,10 @@ class DocumentUploadForm(forms.ModelForm):
             'tags': forms.TextInput(attrs={'placeholder': 'Enter tags separated by commas'}),
         }
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, upload_errors=None, **kwargs):
         super().__init__(*args, **kwargs)
+        # Reasons the upload handlers dropped files while they streamed in
+        self.upload_errors = upload_errors or {}
         self.helper = FormHelper()
         self.helper.form_method = 'post'
         self.helper.form_enctype = 'multipart/form-data'
@@ -120,8 +122,15 @@ class DocumentUploadForm(forms.ModelForm):
         """Validate file type and size"""
         from django.conf import settings
         
+        if 'file' in self.upload_errors:
+            raise forms.ValidationError(self.upload_errors['file'])
+
         file = self.cleaned_data.get('file')
         if file:
+            # Rejected by the upload handler once the whole file was received
+            if getattr(file, 'upload_error', ''):
+                raise forms.ValidationError(file.upload_error)
+
             # Check file size
             if file.size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
                 raise forms.ValidationError(
@@ -142,6 +151,52 @@ class DocumentUploadForm(forms.ModelForm):
         return cleaned_data
 
 
+class UploadSessionForm(forms.ModelForm):
+    """Metadata and file details that open a resumable upload session"""
+    filename = forms.CharField(max_length=255)
+    content_type = forms.CharField(max_length=100)
+    size = forms.IntegerField(min_value=1)
+
+    class Meta:
+        model = Document
+        fields = [
+            'title',
+            'description',
+            'classification',
+            'section',
+            'category',
+            'tags',
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['section'].choices = _folder_choices()
+
+    def clean_content_type(self):
+        from django.conf import settings
+
+        content_type = self.cleaned_data['content_type']
+        if content_type not in settings.ALLOWED_DOCUMENT_TYPES:
+            raise forms.ValidationError(
+                f'File type {content_type} is not allowed. Allowed types: PDF, Word, Excel, Text, Images'
+            )
+        return content_type
+
+    def clean_size(self):
+        from django.conf import settings
+
+        size = self.cleaned_data['size']
+        if size > settings.UPLOAD_SESSION_MAX_SIZE:
+            raise forms.ValidationError(
+                f'File size must not exceed {settings.UPLOAD_SESSION_MAX_SIZE / (1024*1024)}MB'
+            )
+        return size
+
+    def document_metadata(self):
+        """Return the cleaned document fields to store on the session"""
+        return {field: self.cleaned_data[field] for field in self._meta.fields}
+
+
 class DocumentUpdateForm(forms.ModelForm):
     """Form for updating document metadata"""
     class Meta:
@@ -185,7 +240,7 @@ class DocumentSearchForm(forms.Form):
     query = forms.CharField(
         max_length=255, 
         required=False,
-        widget=forms.TextInput(attrs={'placeholder': 'Search by title or filename...'})
+        widget=forms.TextInput(attrs={'placeholder': 'Search documents ("phrase", prefix*, -exclude)...'})
     )
     classification = forms.ChoiceField(
         choices=[('', 'All Classifications')] + Document.CLASSIFICATION_CHOICES,
@@ -197,6 +252,11 @@ class DocumentSearchForm(forms.Form):
         required=False,
         widget=forms.TextInput(attrs={'placeholder': 'Category...'})
     )
+    tag = forms.CharField(
+        max_length=50,
+        required=False,
+        widget=forms.TextInput(attrs={'placeholder': 'Exact tag...'})
+    )
     owner = forms.CharField(
         max_length=150,
         required=False,
@@ -0,0 +1,88 @@
+import os
+from collections import Counter
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.defaultfilters import filesizeformat
+
+from documents.compression import compress, encoding_for
+from documents.models import Blob, Document
+
+
+class Command(BaseCommand):
+    help = (
+        'Compress stored document files of the types listed in DOCUMENT_COMPRESSION '
+        'and report the space saved'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Measure the savings without changing any files',
+        )
+
+    def handle(self, *args, **options):
+        totals = Counter()
+        original_bytes = stored_bytes = 0
+        for blob in Blob.objects.filter(encoding='').order_by('pk').iterator():
+            content_type = blob.documents.values_list('file_type', flat=True).first()
+            encoding = encoding_for(content_type)
+            if not encoding:
+                continue
+            status, original, stored = self._compress(blob, encoding, options['dry_run'])
+            totals[status] += 1
+            original_bytes += original
+            stored_bytes += stored
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{blob.sha256}: {status} ({original} -> {stored} bytes)')
+
+        summary = ', '.join(f'{count} {status}' for status, count in sorted(totals.items()))
+        label = 'Document compression dry run' if options['dry_run'] else 'Document compression'
+        self.stdout.write(self.style.SUCCESS(f'{label} complete: {summary or "nothing to do"}'))
+        if original_bytes:
+            saved = original_bytes - stored_bytes
+            self.stdout.write(
+                f'{filesizeformat(original_bytes)} stored in {filesizeformat(stored_bytes)}, '
+                f'saving {filesizeformat(saved)} ({saved / original_bytes:.1%})'
+            )
+
+    def _compress(self, blob, encoding, dry_run):
+        """Compress one blob's file and return its status with the sizes
+        before and after"""
+        name = blob.name
+        if not default_storage.exists(name):
+            return 'missing', 0, 0
+        size = default_storage.size(name)
+        with default_storage.open(name, 'rb') as file:
+            compressed = compress(file, encoding)
+        if compressed is None:
+            return 'incompressible', size, size
+
+        with compressed:
+            compressed_size = compressed.seek(0, os.SEEK_END)
+            compressed.seek(0)
+            if dry_run:
+                return 'compressed', size, compressed_size
+            written = None
+            try:
+                with transaction.atomic():
+                    # The row lock keeps store_blob from restoring the old name meanwhile
+                    blob = Blob.objects.select_for_update().filter(pk=blob.pk, encoding='').first()
+                    if blob is None:
+                        return 'skipped', 0, 0
+                    blob.encoding = encoding
+                    default_storage.delete(blob.name)
+                    written = default_storage.save(blob.name, File(compressed))
+                    blob.save(update_fields=['encoding'])
+                    # update() skips the signals, which would store the file again
+                    Document.objects.filter(blob=blob).update(file=blob.name)
+                    transaction.on_commit(lambda: default_storage.delete(name))
+            except BaseException:
+                # Nothing refers to the compressed copy once the transaction is rolled back
+                if written is not None:
+                    default_storage.delete(written)
+                raise
+        return 'compressed', size, compressed_size
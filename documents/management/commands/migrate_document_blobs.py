@@ -0,0 +1,61 @@
+import os
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from documents.blobs import delete_unreferenced_blob, store_blob
+from documents.models import Blob, Document
+
+
+class Command(BaseCommand):
+    help = 'Move document files into deduplicated blob storage and recount blob references'
+
+    def handle(self, *args, **options):
+        totals = Counter()
+        documents = (
+            Document.objects.filter(blob__isnull=True)
+            .exclude(file='')
+            .exclude(file__isnull=True)
+            .order_by('pk')
+        )
+        for document in documents.iterator():
+            status = self._convert(document)
+            totals[status] += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{document.pk}: {status}')
+
+        # Writes that bypass the signals leave counts behind, so recount all
+        blobs = Blob.objects.annotate(references=Count('documents')).order_by('pk')
+        for blob in blobs.iterator():
+            if blob.ref_count != blob.references:
+                Blob.objects.filter(pk=blob.pk).update(ref_count=blob.references)
+                totals['recounted'] += 1
+            if not blob.references and delete_unreferenced_blob(blob.pk):
+                totals['deleted'] += 1
+
+        summary = ', '.join(f'{count} {status}' for status, count in sorted(totals.items()))
+        self.stdout.write(self.style.SUCCESS(f'Document blob migration complete: {summary or "nothing to do"}'))
+
+    def _convert(self, document):
+        legacy_name = document.file.name
+        if not default_storage.exists(legacy_name):
+            return 'missing'
+        with transaction.atomic():
+            with default_storage.open(legacy_name, 'rb') as file:
+                blob = store_blob(file, document.file_type)
+            # update() skips the signals, which would store the file again
+            Document.objects.filter(pk=document.pk).update(
+                blob=blob,
+                file=blob.name,
+                file_name=document.file_name or os.path.basename(legacy_name),
+                file_hash=blob.sha256,
+            )
+            transaction.on_commit(lambda: self._delete_legacy_file(legacy_name))
+        return 'deduplicated' if blob.ref_count > 1 else 'converted'
+
+    def _delete_legacy_file(self, name):
+        if not Document.objects.filter(file=name).exists():
+            default_storage.delete(name)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from documents.upload_sessions import purge_expired_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete expired resumable upload sessions and orphaned temporary upload files'
+
+    def handle(self, *args, **options):
+        expired, orphaned = purge_expired_sessions()
+        self.stdout.write(self.style.SUCCESS(
+            f'Upload session purge complete: {expired} expired sessions, {orphaned} orphaned files'
+        ))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.access import document_access_drift, rebuild_document_access
+
+
+class Command(BaseCommand):
+    help = 'Rebuild or verify the materialized document access grants'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Report missing or stale grants without changing anything',
+        )
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            missing, extra = document_access_drift()
+            if options['verbosity'] > 1:
+                for user_id, document_id in sorted(missing):
+                    self.stdout.write(f'missing: user {user_id} document {document_id}')
+                for user_id, document_id in sorted(extra):
+                    self.stdout.write(f'stale: user {user_id} document {document_id}')
+            if missing or extra:
+                raise CommandError(
+                    f'Document access is out of date: {len(missing)} missing, {len(extra)} stale. '
+                    'Run rebuild_document_access to repair it.'
+                )
+            self.stdout.write(self.style.SUCCESS('Document access grants are up to date.'))
+            return
+
+        created, deleted = rebuild_document_access()
+        self.stdout.write(self.style.SUCCESS(
+            f'Document access rebuild complete: {created} created, {deleted} deleted'
+        ))
@@ -0,0 +1,39 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from documents.extraction import extract_document_content
+from documents.models import Document
+
+
+class Command(BaseCommand):
+    help = 'Extract searchable text from document files, skipping files whose hash is unchanged'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Re-parse every file even when its hash matches the stored content',
+        )
+        parser.add_argument(
+            '--document',
+            type=int,
+            action='append',
+            dest='document_ids',
+            help='Only process the given document id (may be repeated)',
+        )
+
+    def handle(self, *args, **options):
+        documents = Document.objects.exclude(file='').exclude(file__isnull=True).order_by('pk')
+        if options['document_ids']:
+            documents = documents.filter(pk__in=options['document_ids'])
+
+        totals = Counter()
+        for document in documents.iterator():
+            status = extract_document_content(document, force=options['force'])
+            totals[status] += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{document.pk}: {status}')
+
+        summary = ', '.join(f'{count} {status}' for status, count in sorted(totals.items()))
+        self.stdout.write(self.style.SUCCESS(f'Document content rebuild complete: {summary or "nothing to do"}'))
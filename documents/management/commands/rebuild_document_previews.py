@@ -0,0 +1,42 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from documents.artifacts import build_document_preview
+from documents.models import Document
+
+
+class Command(BaseCommand):
+    help = 'Render stored document previews, skipping files whose hash is unchanged'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Re-render every preview even when its hash matches the file',
+        )
+        parser.add_argument(
+            '--document',
+            type=int,
+            action='append',
+            dest='document_ids',
+            help='Only process the given document id (may be repeated)',
+        )
+
+    def handle(self, *args, **options):
+        documents = Document.objects.exclude(file='').exclude(file__isnull=True).order_by('pk')
+        if options['document_ids']:
+            documents = documents.filter(pk__in=options['document_ids'])
+
+        totals = Counter()
+        for document in documents.iterator():
+            try:
+                status = build_document_preview(document, force=options['force'])
+            except OSError:
+                status = 'missing'
+            totals[status] += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{document.pk}: {status}')
+
+        summary = ', '.join(f'{count} {status}' for status, count in sorted(totals.items()))
+        self.stdout.write(self.style.SUCCESS(f'Document preview rebuild complete: {summary or "nothing to do"}'))
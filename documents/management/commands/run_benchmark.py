@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from documents.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = 'Run a synthetic benchmark scenario inside a rolled-back transaction'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(BENCHMARKS))
+        parser.add_argument('--documents', type=int, default=None, help='Number of documents to seed')
+        parser.add_argument('--repeat', type=int, default=None, help='Timed repetitions per case')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for synthetic data')
+
+    def handle(self, *args, **options):
+        scenario = BENCHMARKS[options['scenario']]
+        kwargs = {
+            key: options[key]
+            for key in ('documents', 'repeat', 'seed')
+            if options[key] is not None
+        }
+        if kwargs.get('documents', 1) < 1 or kwargs.get('repeat', 1) < 1:
+            raise CommandError('--documents and --repeat must be positive.')
+
+        with transaction.atomic():
+            scenario(self.stdout, **kwargs)
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS(f'Benchmark "{options["scenario"]}" finished; seeded data rolled back.'))
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.14 on 2026-10-16 20:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_document_google_links'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RenameIndex(
+            model_name='document',
+            new_name='documents_d_section_c11c4e_idx',
+            old_name='documents_d_section_6b70d2_idx',
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['section', '-created_at', 'id'], name='documents_d_section_392ce0_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.1.14 on 2026-10-16 20:48
+
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+CREATE_CONTENT_SEARCH_TRIGGER = """
+CREATE OR REPLACE FUNCTION documents_documentcontent_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := to_tsvector('english', coalesce(NEW.content, ''));
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER documents_documentcontent_search_vector_trigger
+BEFORE INSERT OR UPDATE OF content
+ON documents_documentcontent
+FOR EACH ROW EXECUTE FUNCTION documents_documentcontent_search_vector_update();
+
+CREATE INDEX documents_documentcontent_search_vector_gin
+ON documents_documentcontent USING gin (search_vector);
+"""
+
+DROP_CONTENT_SEARCH_TRIGGER = """
+DROP INDEX IF EXISTS documents_documentcontent_search_vector_gin;
+DROP TRIGGER IF EXISTS documents_documentcontent_search_vector_trigger ON documents_documentcontent;
+DROP FUNCTION IF EXISTS documents_documentcontent_search_vector_update();
+"""
+
+
+def create_content_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_CONTENT_SEARCH_TRIGGER)
+
+
+def drop_content_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_CONTENT_SEARCH_TRIGGER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_document_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='file_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.CreateModel(
+            name='DocumentContent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_hash', models.CharField(max_length=64)),
+                ('content', models.TextField(blank=True)),
+                ('extracted_at', models.DateTimeField(auto_now=True)),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(editable=False, null=True)),
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='content', to='documents.document')),
+            ],
+        ),
+        migrations.RunPython(create_content_search_trigger, drop_content_search_trigger),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+# Django compiles icontains on PostgreSQL to UPPER("column"::text) LIKE ...,
+# so the trigram indexes are built on the same expression.
+CREATE_DOCUMENT_TRIGRAM_INDEXES = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS documents_document_category_trgm
+ON documents_document USING gin (UPPER(category::text) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS documents_document_title_trgm
+ON documents_document USING gin (UPPER(title::text) gin_trgm_ops);
+"""
+
+DROP_DOCUMENT_TRIGRAM_INDEXES = """
+DROP INDEX IF EXISTS documents_document_category_trgm;
+DROP INDEX IF EXISTS documents_document_title_trgm;
+"""
+
+
+def create_document_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_DOCUMENT_TRIGRAM_INDEXES)
+
+
+def drop_document_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_DOCUMENT_TRIGRAM_INDEXES)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_user_username_trigram_index'),
+        ('documents', '0008_document_content'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_document_trigram_indexes, drop_document_trigram_indexes),
+    ]
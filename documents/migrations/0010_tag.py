@@ -0,0 +1,85 @@
+# Generated by Django 5.1.14 on 2026-10-16 20:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+BATCH_SIZE = 1000
+
+
+def _parse_tags(value):
+    names = []
+    for part in (value or '').split(','):
+        name = ' '.join(part.split()).lower()[:50].strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def populate_tags(apps, schema_editor):
+    Document = apps.get_model('documents', 'Document')
+    Tag = apps.get_model('documents', 'Tag')
+    DocumentTag = apps.get_model('documents', 'DocumentTag')
+
+    document_tags = [
+        (document_id, _parse_tags(tags))
+        for document_id, tags in Document.objects.exclude(tags='').values_list('id', 'tags').iterator()
+    ]
+    names = {name for _document_id, tag_names in document_tags for name in tag_names}
+    Tag.objects.bulk_create(
+        [Tag(name=name) for name in sorted(names)],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    tag_ids = dict(Tag.objects.values_list('name', 'id'))
+    DocumentTag.objects.bulk_create(
+        [
+            DocumentTag(document_id=document_id, tag_id=tag_ids[name])
+            for document_id, tag_names in document_tags
+            for name in tag_names
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0009_document_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DocumentTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_tags', to='documents.document')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_tags', to='documents.tag')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='tag_set',
+            field=models.ManyToManyField(blank=True, related_name='documents', through='documents.DocumentTag', to='documents.tag'),
+        ),
+        migrations.AddIndex(
+            model_name='documenttag',
+            index=models.Index(fields=['tag', 'document'], name='documents_d_tag_id_e118e1_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='documenttag',
+            constraint=models.UniqueConstraint(fields=('document', 'tag'), name='unique_document_tag'),
+        ),
+        migrations.RunPython(populate_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.14 on 2026-10-16 21:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+BATCH_SIZE = 1000
+
+
+def populate_document_access(apps, schema_editor):
+    Document = apps.get_model('documents', 'Document')
+    DocumentAccess = apps.get_model('documents', 'DocumentAccess')
+    grants = set(Document.objects.values_list('owner_id', 'id').iterator())
+    grants.update(
+        Document.shared_with.through.objects.values_list('user_id', 'document_id').iterator()
+    )
+    DocumentAccess.objects.bulk_create(
+        [DocumentAccess(user_id=user_id, document_id=document_id) for user_id, document_id in grants],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0010_tag'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access_grants', to='documents.document')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_access', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'document'), name='unique_document_access')],
+            },
+        ),
+        migrations.RunPython(populate_document_access, migrations.RunPython.noop),
+    ]
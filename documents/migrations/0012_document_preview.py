@@ -0,0 +1,29 @@
+# Generated by Django 5.1.14 on 2026-10-16 22:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0011_document_access'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentPreview',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_hash', models.CharField(max_length=64)),
+                ('preview_type', models.CharField(max_length=20)),
+                ('text', models.TextField(blank=True)),
+                ('rows', models.JSONField(blank=True, default=list)),
+                ('sheet_name', models.CharField(blank=True, max_length=255)),
+                ('truncated', models.BooleanField(default=False)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('generated_at', models.DateTimeField(auto_now=True)),
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='preview', to='documents.document')),
+            ],
+        ),
+    ]
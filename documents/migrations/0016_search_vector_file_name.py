@@ -0,0 +1,78 @@
+from django.db import migrations
+
+
+# Since blob storage ``file`` holds the content hash, so the name the file
+# was uploaded under is indexed from ``file_name``. Documents not yet moved
+# into blobs have no ``file_name`` and keep using their storage path.
+SEARCH_FUNCTION = """
+CREATE OR REPLACE FUNCTION documents_document_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.tags, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(NEW.category, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(NEW.description, '')), 'C') ||
+        setweight(to_tsvector(
+            'english',
+            regexp_replace(coalesce(nullif(NEW.file_name, ''), NEW.file, ''), '^.*/|[._-]+', ' ', 'g')
+        ), 'D');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+CREATE_SEARCH_TRIGGER = SEARCH_FUNCTION + """
+DROP TRIGGER IF EXISTS documents_document_search_vector_trigger ON documents_document;
+CREATE TRIGGER documents_document_search_vector_trigger
+BEFORE INSERT OR UPDATE OF title, description, tags, category, file, file_name
+ON documents_document
+FOR EACH ROW EXECUTE FUNCTION documents_document_search_vector_update();
+
+UPDATE documents_document SET title = title;
+"""
+
+RESTORE_SEARCH_TRIGGER = """
+CREATE OR REPLACE FUNCTION documents_document_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.tags, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(NEW.category, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(NEW.description, '')), 'C') ||
+        setweight(to_tsvector(
+            'english',
+            regexp_replace(coalesce(NEW.file, ''), '^.*/|[._-]+', ' ', 'g')
+        ), 'D');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS documents_document_search_vector_trigger ON documents_document;
+CREATE TRIGGER documents_document_search_vector_trigger
+BEFORE INSERT OR UPDATE OF title, description, tags, category, file
+ON documents_document
+FOR EACH ROW EXECUTE FUNCTION documents_document_search_vector_update();
+
+UPDATE documents_document SET title = title;
+"""
+
+
+def create_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SEARCH_TRIGGER)
+
+
+def restore_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(RESTORE_SEARCH_TRIGGER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0015_blob_encoding'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_trigger, restore_search_trigger),
+    ]
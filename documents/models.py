@@ -1,16 +1,44 @@
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
 from django.conf import settings
 import os
+import uuid
+
+from .compression import SUFFIXES as COMPRESSION_SUFFIXES
+from .thumbnails import supports_thumbnail
 
 
 def document_upload_path(instance, filename):
-    """Generate upload path for documents"""
+    """Generate upload path for documents not stored as blobs"""
     return (
         f'documents/{instance.section}/{instance.classification}/'
         f'{instance.owner.username}/{filename}'
     )
 
 
+class Blob(models.Model):
+    """A stored file, kept once per SHA-256 and shared by every document
+    with the same content"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    # Extension of the first upload; some parsers refuse files without one
+    extension = models.CharField(max_length=10, blank=True)
+    size = models.BigIntegerField(default=0)  # in bytes
+    # Compression the file is stored with at rest, '' for none
+    encoding = models.CharField(max_length=10, blank=True, default='')
+    # Documents referencing the blob; the file is deleted when it drops to 0
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
+    @property
+    def name(self):
+        """Storage name of the file, fanned out by the leading hash digits"""
+        suffix = COMPRESSION_SUFFIXES.get(self.encoding, '')
+        return f'blobs/{self.sha256[:2]}/{self.sha256[2:4]}/{self.sha256}{self.extension}{suffix}'
+
+
 class DocumentFolder(models.Model):
     """Folder for organizing documents"""
     key = models.CharField(max_length=50, unique=True)
@@ -25,6 +53,17 @@ class DocumentFolder(models.Model):
         ordering = ['name']
 
 
+class Tag(models.Model):
+    """Normalized document tag"""
+    name = models.CharField(max_length=50, unique=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        ordering = ['name']
+
+
 class Document(models.Model):
     """Document model with metadata and access control"""
     CLASSIFICATION_CHOICES = [
@@ -47,6 +86,18 @@ class Document(models.Model):
     file = models.FileField(upload_to=document_upload_path, blank=True, null=True)
     file_size = models.IntegerField(default=0)  # in bytes
     file_type = models.CharField(max_length=100)
+    file_hash = models.CharField(max_length=64, blank=True, editable=False)  # SHA-256 of the file
+    # Uploaded files are stored as content-addressed blobs; ``file`` names the
+    # blob and ``file_name`` keeps the name the file was uploaded under
+    blob = models.ForeignKey(
+        Blob,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='documents'
+    )
+    file_name = models.CharField(max_length=255, blank=True, editable=False)
     google_docs_url = models.URLField(blank=True)
     google_sheets_url = models.URLField(blank=True)
     
@@ -68,6 +119,13 @@ class Document(models.Model):
     )
     category = models.CharField(max_length=100, blank=True)
     tags = models.CharField(max_length=255, blank=True, help_text="Comma-separated tags")
+    # Normalized copy of ``tags``, kept in sync when the document is saved
+    tag_set = models.ManyToManyField(
+        Tag,
+        through='DocumentTag',
+        blank=True,
+        related_name='documents'
+    )
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -84,6 +142,9 @@ class Document(models.Model):
         related_name='archived_documents'
     )
     
+    # Full-text search (maintained by a database trigger on PostgreSQL)
+    search_vector = SearchVectorField(null=True, editable=False)
+    
     # Access control
     shared_with = models.ManyToManyField(
         settings.AUTH_USER_MODEL,
@@ -93,6 +154,24 @@ class Document(models.Model):
     
     def __str__(self):
         return self.title
+
+    def save(self, *args, **kwargs):
+        """Save the row together with the blob reference ``pre_save`` takes
+        for a newly assigned file, so a failed save leaves neither behind"""
+        try:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+        except BaseException:
+            stored = self.__dict__.pop('_stored_blob', None)
+            if stored is not None:
+                from .blobs import discard_blob_file
+
+                sha256, name, upload, blob_id = stored
+                discard_blob_file(sha256, name)
+                self.__dict__.pop('_replaced_blob_id', None)
+                self.file = upload
+                self.blob_id = blob_id
+            raise
     
     def get_tags_list(self):
         """Return tags as a list"""
@@ -100,11 +179,20 @@ class Document(models.Model):
             return [tag.strip() for tag in self.tags.split(',')]
         return []
     
-    def get_file_extension(self):
-        """Get file extension"""
+    @property
+    def filename(self):
+        """Name the file was uploaded under"""
         if not self.file:
             return ''
-        return os.path.splitext(self.file.name)[1].lower()
+        return self.file_name or os.path.basename(self.file.name)
+
+    def get_file_extension(self):
+        """Get file extension"""
+        return os.path.splitext(self.filename)[1].lower()
+
+    @property
+    def has_thumbnail(self):
+        return bool(self.file) and supports_thumbnail(self.get_file_extension())
     
     class Meta:
         ordering = ['-created_at']
@@ -114,4 +202,120 @@ class Document(models.Model):
             models.Index(fields=['category']),
             models.Index(fields=['is_archived']),
             models.Index(fields=['section']),
+            models.Index(fields=['section', '-created_at', 'id']),
+        ]
+
+
+class DocumentTag(models.Model):
+    """Link between a document and one of its tags"""
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='document_tags'
+    )
+    tag = models.ForeignKey(
+        Tag,
+        on_delete=models.CASCADE,
+        related_name='document_tags'
+    )
+
+    def __str__(self):
+        return f'{self.document} - {self.tag}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'tag'], name='unique_document_tag'),
+        ]
+        indexes = [
+            models.Index(fields=['tag', 'document']),
+        ]
+
+
+class DocumentAccess(models.Model):
+    """Explicit access grant from ownership or sharing, kept in sync by signals"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='document_access'
+    )
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='access_grants'
+    )
+
+    def __str__(self):
+        return f'{self.user} - {self.document}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'document'], name='unique_document_access'),
+        ]
+
+
+class DocumentPreview(models.Model):
+    """Preview rendered from a document's file, stored once per file version"""
+    document = models.OneToOneField(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='preview'
+    )
+    file_hash = models.CharField(max_length=64)
+    preview_type = models.CharField(max_length=20)
+    text = models.TextField(blank=True)
+    rows = models.JSONField(default=list, blank=True)
+    sheet_name = models.CharField(max_length=255, blank=True)
+    truncated = models.BooleanField(default=False)
+    error = models.CharField(max_length=255, blank=True)
+    generated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Preview of {self.document}'
+
+
+class DocumentContent(models.Model):
+    """Text extracted from a document's file for in-file search"""
+    document = models.OneToOneField(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='content'
+    )
+    file_hash = models.CharField(max_length=64)
+    content = models.TextField(blank=True)
+    extracted_at = models.DateTimeField(auto_now=True)
+
+    # Full-text search (maintained by a database trigger on PostgreSQL)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    def __str__(self):
+        return f'Content of {self.document}'
+
+
+class UploadSession(models.Model):
+    """A resumable upload in progress, received in chunks into a temporary file"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions'
+    )
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.BigIntegerField()  # in bytes
+    offset = models.BigIntegerField(default=0)  # bytes received and acknowledged
+    # Validated document fields, applied when the upload is completed
+    metadata = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'Upload of {self.filename}'
+
+    @property
+    def path(self):
+        return os.path.join(settings.UPLOAD_SESSION_DIR, f'{self.pk}.part')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at']),
         ]
@@ -0,0 +1,78 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def _field_name(ordering_field):
+    return ordering_field.lstrip('-')
+
+
+def encode_cursor(obj, ordering):
+    """Encode the ordering values of ``obj`` into an opaque cursor token"""
+    values = []
+    for ordering_field in ordering:
+        value = getattr(obj, _field_name(ordering_field))
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        values.append(value)
+    payload = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, ordering, model):
+    """Decode a cursor token back into typed ordering values"""
+    padded = token + '=' * (-len(token) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (binascii.Error, UnicodeError, ValueError) as exc:
+        raise InvalidCursor('Malformed pagination cursor.') from exc
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise InvalidCursor('Pagination cursor does not match the ordering.')
+
+    decoded = []
+    for ordering_field, value in zip(ordering, values):
+        try:
+            field = model._meta.get_field(_field_name(ordering_field))
+        except FieldDoesNotExist:
+            # Annotations (e.g. search rank) are stored as plain JSON values.
+            decoded.append(value)
+            continue
+        try:
+            decoded.append(field.to_python(value))
+        except ValidationError as exc:
+            raise InvalidCursor('Pagination cursor contains invalid values.') from exc
+    return decoded
+
+
+def keyset_filter(ordering, values):
+    """Build a Q selecting rows that sort strictly after ``values``"""
+    condition = Q()
+    equal = Q()
+    for ordering_field, value in zip(ordering, values):
+        name = _field_name(ordering_field)
+        lookup = 'lt' if ordering_field.startswith('-') else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def paginate_keyset(queryset, ordering, cursor=None, page_size=25):
+    """Return one page of ``queryset`` and the cursor for the next page"""
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        values = decode_cursor(cursor, ordering, queryset.model)
+        queryset = queryset.filter(keyset_filter(ordering, values))
+
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = encode_cursor(items[-1], ordering)
+    return items, next_cursor
@@ -1,44 +1,109 @@
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.query import QuerySet
 
+from accounts.models import Role
 
-def can_access_document(user, document):
-    """Check if user can access a document"""
+from .models import Document, DocumentAccess
+
+
+def _role_allows(user, classification):
+    """Check the rules that depend only on the user's role and the classification"""
     # Advisers can access all documents
-    if user.is_adviser or user.is_superuser:
+    if user.has_capability(Role.VIEW_ALL_DOCUMENTS):
         return True
-    
+
     # Presidents can access all documents except restricted
-    if user.is_president and document.classification != 'RESTRICTED':
-        return True
-    
-    # Owner can always access their own documents
-    if document.owner == user:
+    if user.has_capability(Role.VIEW_UNRESTRICTED_DOCUMENTS) and classification != 'RESTRICTED':
         return True
-    
-    # Check if document is shared with the user
-    if document.shared_with.filter(id=user.id).exists():
+
+    # Public documents can be accessed by anyone
+    return classification == 'PUBLIC'
+
+
+def can_access_document(user, document):
+    """Check if user can access a document"""
+    if _role_allows(user, document.classification):
         return True
     
-    # Public documents can be accessed by anyone
-    if document.classification == 'PUBLIC':
+    # Owner can always access their own documents
+    if document.owner_id == user.pk:
         return True
     
-    return False
+    # Users the document is shared with hold an access grant
+    return DocumentAccess.objects.filter(user_id=user.pk, document_id=document.pk).exists()
+
+
+def filter_accessible(user, documents):
+    """Return the documents in ``documents`` the user can access.
+
+    A queryset is filtered in the database. Any other iterable of documents
+    is resolved with at most one query for the sharing grants, however many
+    documents it holds, and returned as a list in the original order.
+    """
+    if isinstance(documents, QuerySet):
+        return documents.filter(get_accessible_documents(user))
+
+    documents = list(documents)
+    pending = {
+        document.pk for document in documents
+        if not _role_allows(user, document.classification) and document.owner_id != user.pk
+    }
+    if pending:
+        granted = set(
+            DocumentAccess.objects.filter(
+                user_id=user.pk,
+                document_id__in=pending,
+            ).values_list('document_id', flat=True)
+        )
+        pending -= granted
+    return [document for document in documents if document.pk not in pending]
+
+
+def accessible_ids(user, ids):
+    """Return the subset of document ``ids`` the user can access, in one query"""
+    ids = set(ids)
+    if not ids:
+        return set()
+    return set(
+        Document.objects.filter(
+            get_accessible_documents(user),
+            pk__in=ids,
+        ).values_list('pk', flat=True)
+    )
+
+
+def granted_to_user(user):
+    """Return a correlated EXISTS condition matching documents owned by or
+    shared with ``user``"""
+    return Exists(
+        DocumentAccess.objects.filter(
+            user_id=user.pk,
+            document_id=OuterRef('pk'),
+        )
+    )
 
 
 def get_accessible_documents(user):
-    """Get queryset of documents accessible to the user"""
-    if user.is_adviser or user.is_superuser:
+    """Get a filter for the documents accessible to the user.
+
+    Ownership and sharing are checked with one indexed EXISTS lookup against
+    ``DocumentAccess``, so each document matches at most once and callers
+    need no DISTINCT.
+    """
+    if user.has_capability(Role.VIEW_ALL_DOCUMENTS):
         # Advisers can see all documents
         return Q()
-    elif user.is_president:
-        # Presidents can see all except restricted
-        return Q(classification__in=['PUBLIC', 'INTERNAL', 'CONFIDENTIAL']) | Q(owner=user)
+    elif user.has_capability(Role.VIEW_UNRESTRICTED_DOCUMENTS):
+        # Presidents can see all except restricted, unless it was granted to them
+        return (
+            Q(classification__in=['PUBLIC', 'INTERNAL', 'CONFIDENTIAL'])
+            | Q(granted_to_user(user))
+        )
     else:
         # Regular users can see their own, shared with them, and public documents
-        return Q(owner=user) | Q(shared_with=user) | Q(classification='PUBLIC')
+        return Q(classification='PUBLIC') | Q(granted_to_user(user))
 
 
 def can_manage_folders(user):
     """Check if user can manage document folders"""
-    return user.is_adviser or user.is_president or user.is_superuser
+    return user.has_capability(Role.MANAGE_FOLDERS)
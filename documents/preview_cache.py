@@ -0,0 +1,141 @@
+"""Two-tier cache for rendered previews.
+
+Rendered previews and spreadsheet windows are cached under the SHA-256 of
+the file they were read from, so identical files share entries and a
+changed file misses without any invalidation. The first tier is an
+in-process LRU bounded by a byte budget; the second is the ``previews``
+Django cache (on disk by default, shareable between processes), which
+applies its own timeout and culls entries when it grows past
+``MAX_ENTRIES``. Values larger than ``PREVIEW_CACHE_MAX_ENTRY_BYTES`` are
+not cached in either tier.
+"""
+import hashlib
+import pickle
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+SHARED_CACHE_ALIAS = 'previews'
+KEY_PREFIX = 'preview'
+
+
+class MemoryTier:
+    """A thread-safe LRU of pickled values bounded by their total size"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                return None
+            self._entries.move_to_end(key)
+        return pickle.loads(data)
+
+    def set(self, key, data):
+        """Store already pickled ``data``; values over the budget are dropped"""
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous)
+            self._entries[key] = data
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes:
+                _key, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class PreviewCache:
+    """The memory tier of this process in front of the shared cache"""
+
+    def __init__(self):
+        self._memory = None
+        self._lock = threading.Lock()
+        self._counters = {'memory_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    @property
+    def memory(self):
+        if self._memory is None:
+            self._memory = MemoryTier(settings.PREVIEW_CACHE_MEMORY_BYTES)
+        return self._memory
+
+    @property
+    def shared(self):
+        return caches[SHARED_CACHE_ALIAS]
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def get_or_render(self, key_parts, render, refresh=False):
+        """Return the cached value for ``key_parts``, calling ``render`` on a miss.
+
+        ``refresh`` skips the lookup and replaces any cached value.
+        Exceptions from ``render`` propagate and nothing is cached.
+        """
+        # Hashed so sheet names and other parts are safe in any cache backend
+        digest = hashlib.sha256('\0'.join(str(part) for part in key_parts).encode()).hexdigest()
+        key = f'{KEY_PREFIX}:{digest}'
+        if not refresh:
+            value = self.memory.get(key)
+            if value is not None:
+                self._count('memory_hits')
+                return value
+
+            data = self.shared.get(key)
+            if data is not None:
+                self._count('shared_hits')
+                self.memory.set(key, data)
+                return pickle.loads(data)
+
+        self._count('misses')
+        value = render()
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) <= settings.PREVIEW_CACHE_MAX_ENTRY_BYTES:
+            self.memory.set(key, data)
+            self.shared.set(key, data)
+        return value
+
+    def stats(self):
+        """Return hit and miss counters and the memory tier's usage"""
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = sum(counters.values())
+        hits = counters['memory_hits'] + counters['shared_hits']
+        return {
+            **counters,
+            'hit_rate': hits / lookups if lookups else None,
+            'memory_entries': len(self.memory),
+            'memory_bytes': self.memory.bytes,
+            'memory_max_bytes': self.memory.max_bytes,
+            'memory_evictions': self.memory.evictions,
+        }
+
+    def clear(self):
+        """Empty both tiers and reset the counters"""
+        self.memory.clear()
+        self.shared.clear()
+        with self._lock:
+            self._counters = dict.fromkeys(self._counters, 0)
+
+
+preview_cache = PreviewCache()
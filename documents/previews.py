@@ -0,0 +1,424 @@
+"""File readers shared by document previews and content extraction.
+
+Readers accept a file path and optional limits; passing ``None`` for a limit
+reads the whole file. Text is read through ``compression.open_stored``, so
+files stored compressed read like any other. Apart from that module's
+settings, this module deliberately has no Django dependencies.
+"""
+import io
+import os
+import re
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+
+from lxml import etree
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+from pypdf import PdfReader
+from pypdf.errors import PyPdfError
+
+from .compression import open_stored
+
+
+PREVIEW_CHAR_LIMIT = 8000
+PREVIEW_ROW_LIMIT = 25
+PREVIEW_COLUMN_LIMIT = 10
+PREVIEW_CELL_LIMIT = 200
+PREVIEW_MAX_FILE_SIZE = 5 * 1024 * 1024
+PDF_PREVIEW_PAGE_LIMIT = 3
+SPREADSHEET_WINDOW_ROW_LIMIT = 200
+SPREADSHEET_WINDOW_COLUMN_LIMIT = 50
+WORKBOOK_CACHE_SIZE = 4
+WORKBOOK_CACHE_SECONDS = 300
+CONTROL_CHAR_PATTERN = re.compile(r'[\x00-\x1F\x7F]')
+
+WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+W_BODY = f'{WORD_NAMESPACE}body'
+W_PARAGRAPH = f'{WORD_NAMESPACE}p'
+W_RUN = f'{WORD_NAMESPACE}r'
+W_HYPERLINK = f'{WORD_NAMESPACE}hyperlink'
+W_TEXT = f'{WORD_NAMESPACE}t'
+W_BREAK = f'{WORD_NAMESPACE}br'
+W_BREAK_TYPE = f'{WORD_NAMESPACE}type'
+# Run children rendered as fixed text; line breaks depend on their type
+RUN_CHILD_TEXT = {
+    f'{WORD_NAMESPACE}tab': '\t',
+    f'{WORD_NAMESPACE}ptab': '\t',
+    f'{WORD_NAMESPACE}cr': '\n',
+    f'{WORD_NAMESPACE}noBreakHyphen': '-',
+}
+DOCX_BODY_PART = 'word/document.xml'
+DOCX_HEADER_PART_PATTERNS = (
+    re.compile(r'word/header\d*\.xml'),
+    re.compile(r'word/footer\d*\.xml'),
+)
+DOCX_NOTE_PARTS = ('word/footnotes.xml', 'word/endnotes.xml')
+
+
+class PreviewError(Exception):
+    """Raised when a preview cannot be generated.
+
+    ``reason`` is ``UNREADABLE`` for files whose contents cannot be parsed,
+    or one of the sandbox reasons when parsing hit a resource limit.
+    """
+
+    UNREADABLE = 'unreadable'
+    TIMEOUT = 'timeout'
+    MEMORY_LIMIT = 'memory_limit'
+    CRASHED = 'crashed'
+    BUSY = 'busy'
+
+    def __init__(self, message='', reason=UNREADABLE):
+        super().__init__(message)
+        self.reason = reason
+
+    def __reduce__(self):
+        # Keep the reason when the error is sent back from a sandbox process
+        return self.__class__, (str(self), self.reason)
+
+
+def _truncate_text(text, limit=PREVIEW_CHAR_LIMIT):
+    if not text:
+        return '', False
+    if limit is None:
+        return text, False
+    truncated = len(text) > limit
+    return text[:limit], truncated
+
+
+def load_text_preview(file_path, limit=PREVIEW_CHAR_LIMIT):
+    try:
+        with io.TextIOWrapper(open_stored(file_path), encoding='utf-8', errors='replace') as file:
+            content = file.read() if limit is None else file.read(limit + 1)
+    except (OSError, UnicodeError) as exc:
+        raise PreviewError('Unable to read text preview.') from exc
+    return _truncate_text(content, limit)
+
+
+def _run_text(run):
+    parts = []
+    for child in run:
+        if child.tag == W_TEXT:
+            parts.append(child.text or '')
+        elif child.tag == W_BREAK:
+            # Page and column breaks have no text equivalent
+            if child.get(W_BREAK_TYPE, 'textWrapping') == 'textWrapping':
+                parts.append('\n')
+        else:
+            parts.append(RUN_CHILD_TEXT.get(child.tag, ''))
+    return ''.join(parts)
+
+
+def _paragraph_text(paragraph):
+    """Return paragraph text the way python-docx's ``Paragraph.text`` does"""
+    parts = []
+    for child in paragraph:
+        if child.tag == W_RUN:
+            parts.append(_run_text(child))
+        elif child.tag == W_HYPERLINK:
+            parts.extend(_run_text(run) for run in child if run.tag == W_RUN)
+    return ''.join(parts)
+
+
+def _iter_part_paragraphs(package, part_name, body_only):
+    """Yield paragraph text from one XML part without building the whole tree.
+
+    Each paragraph is discarded once read, so memory stays flat however
+    long the document is. With ``body_only`` only top-level body paragraphs
+    are yielded, skipping those nested in tables and text boxes.
+    """
+    with package.open(part_name) as part:
+        for _event, element in etree.iterparse(
+            part,
+            events=('end',),
+            tag=W_PARAGRAPH,
+            resolve_entities=False,
+            no_network=True,
+        ):
+            parent = element.getparent()
+            if not body_only or (parent is not None and parent.tag == W_BODY):
+                text = _paragraph_text(element)
+                if text:
+                    yield text
+            # Drop finished paragraphs so the parsed tree never grows
+            element.clear()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+
+
+def load_docx_preview(
+    file_path,
+    limit=PREVIEW_CHAR_LIMIT,
+    include_tables=False,
+    include_headers=False,
+    include_notes=False,
+):
+    """Stream paragraph text out of a .docx file, stopping at ``limit``.
+
+    By default this matches the body paragraphs python-docx returns.
+    ``include_tables`` adds paragraphs inside tables in document order,
+    ``include_headers`` appends header and footer text and
+    ``include_notes`` appends footnotes and endnotes.
+    """
+    paragraphs = []
+    length = 0
+    try:
+        with zipfile.ZipFile(file_path) as package:
+            part_names = [(DOCX_BODY_PART, not include_tables)]
+            names = sorted(package.namelist())
+            if include_headers:
+                for pattern in DOCX_HEADER_PART_PATTERNS:
+                    part_names.extend((name, False) for name in names if pattern.fullmatch(name))
+            if include_notes:
+                part_names.extend((name, False) for name in DOCX_NOTE_PARTS if name in names)
+
+            for part_name, body_only in part_names:
+                for text in _iter_part_paragraphs(package, part_name, body_only):
+                    paragraphs.append(text)
+                    # Account for the newline joining this paragraph to the last
+                    length += len(text) + (1 if len(paragraphs) > 1 else 0)
+                    if limit is not None and length > limit:
+                        return _truncate_text('\n'.join(paragraphs), limit)
+    except (zipfile.BadZipFile, KeyError, etree.XMLSyntaxError, OSError, ValueError) as exc:
+        raise PreviewError('Unable to read Word document preview.') from exc
+    return _truncate_text('\n'.join(paragraphs), limit)
+
+
+def spreadsheet_sheet_names(file_path):
+    workbook = None
+    try:
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        return list(workbook.sheetnames)
+    except (InvalidFileException, OSError, ValueError, KeyError) as exc:
+        raise PreviewError('Unable to read spreadsheet preview.') from exc
+    finally:
+        if workbook is not None:
+            workbook.close()
+
+
+_open_workbooks = OrderedDict()
+_open_workbooks_lock = threading.Lock()
+
+
+def _close_workbook(workbook):
+    try:
+        workbook.close()
+    except OSError:
+        pass
+
+
+def _cached_workbook(file_path):
+    """Return a read-only workbook for ``file_path`` from a small LRU cache.
+
+    Paging through a sheet opens the same file again and again, so a few
+    handles are kept open. Entries are keyed by the file's modification
+    time and size so a replaced file is reopened, and are closed after
+    ``WORKBOOK_CACHE_SECONDS`` without use.
+    """
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    now = time.monotonic()
+    expired = []
+    with _open_workbooks_lock:
+        for cached_key, (workbook, used_at) in list(_open_workbooks.items()):
+            if (cached_key[0] == key[0] and cached_key != key) or now - used_at > WORKBOOK_CACHE_SECONDS:
+                expired.append(_open_workbooks.pop(cached_key)[0])
+        entry = _open_workbooks.pop(key, None)
+        if entry is not None:
+            _open_workbooks[key] = (entry[0], now)
+            workbook = entry[0]
+        else:
+            workbook = None
+    for stale in expired:
+        _close_workbook(stale)
+    if workbook is not None:
+        return workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    with _open_workbooks_lock:
+        _open_workbooks[key] = (workbook, now)
+        while len(_open_workbooks) > WORKBOOK_CACHE_SIZE:
+            expired.append(_open_workbooks.popitem(last=False)[1][0])
+    for stale in expired:
+        _close_workbook(stale)
+    return workbook
+
+
+def _cell_text(cell, cell_limit):
+    """Return ``(text, truncated)`` for one spreadsheet cell value"""
+    if cell is None:
+        return '', False
+    try:
+        cell_value = str(cell)
+    except (TypeError, ValueError):
+        return '', True
+    cell_value = CONTROL_CHAR_PATTERN.sub('', cell_value)
+    if cell_limit is not None and len(cell_value) > cell_limit:
+        return f'{cell_value[:cell_limit]}…', True
+    return cell_value, False
+
+
+def load_spreadsheet_window(
+    file_path,
+    sheet_name=None,
+    first_row=1,
+    row_count=PREVIEW_ROW_LIMIT,
+    first_column=1,
+    column_count=PREVIEW_COLUMN_LIMIT,
+    cell_limit=PREVIEW_CELL_LIMIT,
+):
+    """Return one window of rows and columns from any sheet of a workbook.
+
+    Rows and columns are 1-based like Excel's. Counts are capped at
+    ``SPREADSHEET_WINDOW_ROW_LIMIT`` and ``SPREADSHEET_WINDOW_COLUMN_LIMIT``.
+    The result has ``sheet`` set to None when ``sheet_name`` is not in the
+    workbook. ``max_row`` and ``max_column`` come from the sheet's recorded
+    dimensions and are None when the file does not record them.
+    """
+    first_row = max(1, first_row)
+    first_column = max(1, first_column)
+    row_count = max(1, min(row_count, SPREADSHEET_WINDOW_ROW_LIMIT))
+    column_count = max(1, min(column_count, SPREADSHEET_WINDOW_COLUMN_LIMIT))
+    try:
+        workbook = _cached_workbook(file_path)
+        sheet_names = list(workbook.sheetnames)
+        if sheet_name and sheet_name not in sheet_names:
+            return {'sheets': sheet_names, 'sheet': None}
+        sheet = workbook[sheet_name] if sheet_name else workbook.active
+        max_row = sheet.max_row
+        max_column = sheet.max_column
+        # Read-only rows are padded to the requested width; trim the padding
+        width = column_count
+        if max_column is not None:
+            width = max(0, min(column_count, max_column - first_column + 1))
+        rows = []
+        truncated = False
+        # Read one row and column past the window to tell whether more follow
+        for row in sheet.iter_rows(
+            min_row=first_row,
+            max_row=first_row + row_count,
+            min_col=first_column,
+            max_col=first_column + column_count,
+            values_only=True,
+        ):
+            rows.append(row)
+        has_more_rows = len(rows) > row_count
+        has_more_columns = any(len(row) > column_count and row[column_count] is not None for row in rows)
+        window = []
+        for row in rows[:row_count]:
+            row_values = []
+            for cell in row[:width]:
+                cell_value, cell_truncated = _cell_text(cell, cell_limit)
+                truncated = truncated or cell_truncated
+                row_values.append(cell_value)
+            window.append(row_values)
+    except (InvalidFileException, OSError, ValueError, KeyError) as exc:
+        raise PreviewError('Unable to read spreadsheet preview.') from exc
+
+    return {
+        'sheets': sheet_names,
+        'sheet': sheet.title,
+        'first_row': first_row,
+        'first_column': first_column,
+        'rows': window,
+        'has_more_rows': has_more_rows,
+        'has_more_columns': has_more_columns or (
+            max_column is not None and first_column + column_count <= max_column
+        ),
+        'max_row': max_row,
+        'max_column': max_column,
+        'truncated': truncated,
+    }
+
+
+def load_spreadsheet_preview(
+    file_path,
+    sheet_name=None,
+    row_limit=PREVIEW_ROW_LIMIT,
+    column_limit=PREVIEW_COLUMN_LIMIT,
+    cell_limit=PREVIEW_CELL_LIMIT,
+):
+    workbook = None
+    sheet_title = ''
+    rows = []
+    truncated = False
+    try:
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        sheet = workbook[sheet_name] if sheet_name else workbook.active
+        for row_index, row in enumerate(sheet.iter_rows(
+            values_only=True,
+            max_row=None if row_limit is None else row_limit + 1,
+            max_col=None if column_limit is None else column_limit + 1,
+        )):
+            if row_limit is not None and row_index >= row_limit:
+                truncated = True
+                break
+            row_values = []
+            if column_limit is not None and len(row) > column_limit:
+                truncated = True
+            for cell in row[:column_limit]:
+                cell_value, cell_truncated = _cell_text(cell, cell_limit)
+                truncated = truncated or cell_truncated
+                row_values.append(cell_value)
+            rows.append(row_values)
+        sheet_title = sheet.title
+    except (InvalidFileException, OSError, ValueError, KeyError) as exc:
+        raise PreviewError('Unable to read spreadsheet preview.') from exc
+    finally:
+        if workbook is not None:
+            workbook.close()
+
+    return sheet_title, rows, truncated
+
+
+def load_spreadsheet_text(file_path, limit=PREVIEW_CHAR_LIMIT):
+    """Return every sheet of a workbook as tab-separated text"""
+    lines = []
+    for sheet_name in spreadsheet_sheet_names(file_path):
+        _title, rows, _truncated = load_spreadsheet_preview(
+            file_path,
+            sheet_name=sheet_name,
+            row_limit=None,
+            column_limit=None,
+            cell_limit=None,
+        )
+        lines.append(sheet_name)
+        lines.extend('\t'.join(row) for row in rows if any(row))
+    return _truncate_text('\n'.join(lines), limit)
+
+
+def load_pdf_text(file_path, limit=PREVIEW_CHAR_LIMIT, page_limit=None):
+    parts = []
+    length = 0
+    try:
+        reader = PdfReader(file_path)
+        for page_index, page in enumerate(reader.pages):
+            if page_limit is not None and page_index >= page_limit:
+                break
+            text = page.extract_text() or ''
+            parts.append(text)
+            length += len(text)
+            if limit is not None and length > limit:
+                break
+    except (PyPdfError, OSError, ValueError) as exc:
+        raise PreviewError('Unable to read PDF text.') from exc
+    return _truncate_text('\n'.join(parts), limit)
+
+
+def load_pdf_page(file_path, page, limit=PREVIEW_CHAR_LIMIT):
+    """Return the text of one 1-based PDF page with the document's page count.
+
+    The result has ``page`` set to None when the page is out of range.
+    """
+    try:
+        reader = PdfReader(file_path)
+        page_count = len(reader.pages)
+        if not 1 <= page <= page_count:
+            return {'page': None, 'page_count': page_count}
+        text, truncated = _truncate_text(reader.pages[page - 1].extract_text() or '', limit)
+    except (PyPdfError, OSError, ValueError) as exc:
+        raise PreviewError('Unable to read PDF text.') from exc
+    return {'page': page, 'page_count': page_count, 'text': text, 'truncated': truncated}
@@ -0,0 +1,242 @@
+"""Run file parsers in a pool of resource-limited worker processes.
+
+Word, spreadsheet and PDF files are untrusted input, and a zip bomb or a
+pathological shared-strings table can pin a CPU or exhaust memory. Parsers
+therefore run in separate worker processes with an address-space rlimit,
+and a call that outlives its timeout has its worker killed. Workers are
+replaced after a fixed number of tasks so leaked memory is returned, and a
+call that finds every worker busy for too long is turned away instead of
+queueing without bound.
+
+The pool is per process: each web or job worker process starts its own
+sandbox workers on first use. Failures are raised as ``PreviewError`` with
+a ``reason`` saying which limit was hit.
+"""
+import logging
+import multiprocessing
+import resource
+import threading
+
+from django.conf import settings
+
+from .previews import PreviewError
+
+
+logger = logging.getLogger(__name__)
+
+# forkserver workers start from a clean interpreter instead of copying the
+# web process, and unlike fork they can be recycled safely from threads.
+START_METHOD = 'forkserver'
+
+DEFAULT_WORKERS = 2
+DEFAULT_TIMEOUT = 15  # seconds per call
+DEFAULT_MEMORY_LIMIT = 512 * 1024 * 1024  # bytes of address space per worker
+DEFAULT_TASKS_PER_WORKER = 100
+DEFAULT_WAIT_TIMEOUT = 5  # seconds to wait for a free worker
+
+LIMIT_MESSAGES = {
+    PreviewError.TIMEOUT: 'File parsing took too long and was stopped.',
+    PreviewError.MEMORY_LIMIT: 'File parsing needed too much memory and was stopped.',
+    PreviewError.CRASHED: 'File parsing stopped unexpectedly.',
+    PreviewError.BUSY: 'All file parsers are busy.',
+}
+
+
+def _serve(connection, memory_limit):
+    """Worker process loop: run ``(func, args, kwargs)`` calls until closed"""
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    while True:
+        try:
+            func, args, kwargs = connection.recv()
+        except EOFError:
+            return
+        try:
+            result = (True, func(*args, **kwargs))
+        except MemoryError:
+            result = (False, PreviewError(
+                LIMIT_MESSAGES[PreviewError.MEMORY_LIMIT], reason=PreviewError.MEMORY_LIMIT
+            ))
+        except Exception as exc:
+            result = (False, exc)
+        connection.send(result)
+
+
+class _Worker:
+    def __init__(self, context, memory_limit):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=_serve, args=(child_connection, memory_limit), daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+        self.tasks = 0
+
+    @property
+    def alive(self):
+        return self.process.is_alive()
+
+    def call(self, func, args, kwargs, timeout):
+        self.tasks += 1
+        try:
+            self.connection.send((func, args, kwargs))
+            if not self.connection.poll(timeout):
+                self.stop()
+                raise PreviewError(LIMIT_MESSAGES[PreviewError.TIMEOUT], reason=PreviewError.TIMEOUT)
+            ok, value = self.connection.recv()
+        except (EOFError, OSError) as exc:
+            # The worker died, usually killed by the kernel for its memory use
+            self.stop()
+            raise PreviewError(
+                LIMIT_MESSAGES[PreviewError.CRASHED], reason=PreviewError.CRASHED
+            ) from exc
+        if ok:
+            return value
+        raise value
+
+    def stop(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+class SandboxPool:
+    """A bounded pool of parser processes shared by the threads of one process"""
+
+    def __init__(
+        self,
+        workers=DEFAULT_WORKERS,
+        timeout=DEFAULT_TIMEOUT,
+        memory_limit=DEFAULT_MEMORY_LIMIT,
+        tasks_per_worker=DEFAULT_TASKS_PER_WORKER,
+        wait_timeout=DEFAULT_WAIT_TIMEOUT,
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.tasks_per_worker = tasks_per_worker
+        self.wait_timeout = wait_timeout
+        self._context = multiprocessing.get_context(START_METHOD)
+        self._slots = threading.BoundedSemaphore(workers)
+        self._lock = threading.Lock()
+        self._idle = []
+        self._counters = {
+            'busy': 0,
+            'peak_busy': 0,
+            'completed': 0,
+            'rejected': 0,
+            PreviewError.TIMEOUT: 0,
+            PreviewError.MEMORY_LIMIT: 0,
+            PreviewError.CRASHED: 0,
+            'recycled': 0,
+        }
+
+    def run(self, func, *args, **kwargs):
+        """Call ``func(*args, **kwargs)`` in a worker process and return its result.
+
+        ``func`` and its arguments must be picklable and importable without
+        Django, so callers pass the readers from ``documents.previews``.
+        """
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            with self._lock:
+                self._counters['rejected'] += 1
+                stats = dict(self._counters)
+            logger.warning('Parser sandbox saturated; rejected a call (%s)', stats)
+            raise PreviewError(LIMIT_MESSAGES[PreviewError.BUSY], reason=PreviewError.BUSY)
+
+        worker = None
+        with self._lock:
+            self._counters['busy'] += 1
+            self._counters['peak_busy'] = max(self._counters['peak_busy'], self._counters['busy'])
+        try:
+            worker = self._checkout()
+            result = worker.call(func, args, kwargs, self.timeout)
+        except PreviewError as exc:
+            if exc.reason in (PreviewError.TIMEOUT, PreviewError.MEMORY_LIMIT, PreviewError.CRASHED):
+                logger.warning(
+                    'Parser sandbox call %s stopped: %s', getattr(func, '__name__', func), exc.reason
+                )
+                with self._lock:
+                    self._counters[exc.reason] += 1
+                # Don't reuse a worker whose heap just hit the limit
+                if exc.reason == PreviewError.MEMORY_LIMIT:
+                    worker.stop()
+            raise
+        finally:
+            self._checkin(worker)
+            with self._lock:
+                self._counters['busy'] -= 1
+            self._slots.release()
+
+        with self._lock:
+            self._counters['completed'] += 1
+        return result
+
+    def _checkout(self):
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.alive:
+                    return worker
+        return _Worker(self._context, self.memory_limit)
+
+    def _checkin(self, worker):
+        if worker is None:
+            return
+        if worker.alive and worker.tasks < self.tasks_per_worker:
+            with self._lock:
+                self._idle.append(worker)
+            return
+        if worker.alive:
+            with self._lock:
+                self._counters['recycled'] += 1
+        worker.stop()
+
+    def stats(self):
+        """Return the pool size and counters since the pool was created"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'idle_processes': len(self._idle),
+                **self._counters,
+            }
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return this process's sandbox pool, or None when sandboxing is disabled"""
+    global _pool
+    if not settings.PREVIEW_SANDBOX_WORKERS:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool(
+                workers=settings.PREVIEW_SANDBOX_WORKERS,
+                timeout=settings.PREVIEW_SANDBOX_TIMEOUT,
+                memory_limit=settings.PREVIEW_SANDBOX_MEMORY_LIMIT,
+                tasks_per_worker=settings.PREVIEW_SANDBOX_TASKS_PER_WORKER,
+            )
+        return _pool
+
+
+def run_sandboxed(func, *args, **kwargs):
+    """Run a parser in the sandbox pool, or inline when sandboxing is disabled"""
+    pool = get_pool()
+    if pool is None:
+        return func(*args, **kwargs)
+    return pool.run(func, *args, **kwargs)
+
+
+def sandbox_stats():
+    """Return the stats of this process's pool, or None if it has not started"""
+    return _pool.stats() if _pool is not None else None
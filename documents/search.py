@@ -0,0 +1,260 @@
+import re
+from collections import namedtuple
+from difflib import SequenceMatcher
+
+from django.contrib.postgres.search import (
+    SearchHeadline,
+    SearchQuery,
+    SearchRank,
+    TrigramSimilarity,
+    TrigramWordSimilarity,
+)
+from django.db import connection
+from django.db.models import F, Max, Q, TextField, Value
+from django.db.models.functions import Cast, Coalesce, Greatest, Lower, StrIndex, Substr, Upper
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import DocumentContent
+
+
+SEARCH_CONFIG = 'english'
+SEARCH_FALLBACK_FIELDS = ('title', 'description', 'tags', 'category', 'file_name', 'content__content')
+CONTENT_RANK_WEIGHT = 0.5
+SNIPPET_RADIUS = 80
+# Control characters are stripped from extracted content, so they can mark
+# highlight boundaries safely before the snippet is HTML-escaped.
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_STOP = '\x03'
+SUGGESTION_LIMIT = 5
+# Distinct values scanned by the non-PostgreSQL suggestion fallback.
+SUGGESTION_CANDIDATE_LIMIT = 2000
+SUGGESTION_FALLBACK_CUTOFF = 0.6
+TOKEN_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+WORD_PATTERN = re.compile(r'\w+')
+
+SearchTerm = namedtuple('SearchTerm', ['words', 'text', 'phrase', 'prefix', 'negated'])
+
+
+def is_postgresql():
+    """Return True when the default database supports PostgreSQL search"""
+    return connection.vendor == 'postgresql'
+
+
+def parse_search_terms(query):
+    """Split a search string into SearchTerm tuples.
+
+    Supports ``"quoted phrases"``, ``prefix*`` matching and ``-excluded`` terms.
+    """
+    terms = []
+    for phrase, token in TOKEN_PATTERN.findall(query or ''):
+        if phrase:
+            words = WORD_PATTERN.findall(phrase)
+            if words:
+                terms.append(SearchTerm(words, phrase.strip(), True, False, False))
+            continue
+        negated = token.startswith('-') and len(token) > 1
+        prefix = token.endswith('*')
+        words = WORD_PATTERN.findall(token)
+        if words:
+            terms.append(SearchTerm(words, token, False, prefix, negated))
+    return terms
+
+
+def build_tsquery(query):
+    """Translate user input into a raw ``to_tsquery`` expression"""
+    clauses = []
+    for term in parse_search_terms(query):
+        operands = list(term.words)
+        if term.prefix:
+            operands[-1] = f'{operands[-1]}:*'
+        clause = ' <-> '.join(operands)
+        if len(operands) > 1:
+            clause = f'({clause})'
+        if term.negated:
+            clause = f'!{clause}'
+        clauses.append(clause)
+    return ' & '.join(clauses)
+
+
+def _fallback_filter(needle):
+    condition = Q()
+    for field in SEARCH_FALLBACK_FIELDS:
+        condition |= Q(**{f'{field}__icontains': needle})
+    return condition
+
+
+def _build_search_query(query):
+    tsquery = build_tsquery(query)
+    if not tsquery:
+        return None
+    return SearchQuery(tsquery, search_type='raw', config=SEARCH_CONFIG)
+
+
+def search_documents(documents, query):
+    """Apply a metadata search to a document queryset.
+
+    Returns ``(queryset, ranked)``. On PostgreSQL the maintained, weighted
+    ``search_vector`` columns of the document and its extracted content are
+    matched with GIN-indexed tsqueries and the queryset is annotated with
+    ``search_rank``. Other databases fall back to case-insensitive substring
+    matching over the same fields.
+    """
+    if is_postgresql():
+        search_query = _build_search_query(query)
+        if search_query is None:
+            return documents, False
+        documents = documents.filter(
+            Q(search_vector=search_query) | Q(content__search_vector=search_query)
+        ).annotate(
+            search_rank=(
+                Coalesce(SearchRank(F('search_vector'), search_query), Value(0.0))
+                + Coalesce(
+                    SearchRank(F('content__search_vector'), search_query),
+                    Value(0.0),
+                ) * CONTENT_RANK_WEIGHT
+            )
+        )
+        return documents, True
+
+    for term in parse_search_terms(query):
+        if term.phrase:
+            condition = _fallback_filter(term.text)
+        else:
+            condition = Q()
+            for word in term.words:
+                condition &= _fallback_filter(word)
+        documents = documents.exclude(condition) if term.negated else documents.filter(condition)
+    return documents, False
+
+
+def _highlight(fragment, words):
+    """Escape a text fragment and wrap matches of ``words`` in <mark> tags"""
+    pattern = re.compile('|'.join(re.escape(word) for word in words), re.IGNORECASE)
+    marked = pattern.sub(lambda match: f'{HIGHLIGHT_START}{match.group(0)}{HIGHLIGHT_STOP}', fragment)
+    return _render_highlights(marked)
+
+
+def _render_highlights(marked):
+    return mark_safe(
+        escape(marked).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_STOP, '</mark>')
+    )
+
+
+def content_snippets(document_ids, query):
+    """Return ``{document_id: snippet}`` with highlighted matches from file content.
+
+    Only the documents on the current page are passed in, so the headline is
+    computed for a handful of rows rather than the whole result set.
+    """
+    terms = [term for term in parse_search_terms(query) if not term.negated]
+    if not document_ids or not terms:
+        return {}
+
+    contents = DocumentContent.objects.filter(document_id__in=document_ids)
+    if is_postgresql():
+        search_query = _build_search_query(query)
+        contents = contents.filter(search_vector=search_query).annotate(
+            snippet=SearchHeadline(
+                'content',
+                search_query,
+                config=SEARCH_CONFIG,
+                start_sel=HIGHLIGHT_START,
+                stop_sel=HIGHLIGHT_STOP,
+                max_words=30,
+                min_words=12,
+                max_fragments=2,
+            )
+        )
+        return {
+            document_id: _render_highlights(snippet)
+            for document_id, snippet in contents.values_list('document_id', 'snippet')
+            if snippet
+        }
+
+    needle = terms[0].text if terms[0].phrase else terms[0].words[0]
+    contents = contents.annotate(
+        match_position=StrIndex(Lower('content'), Lower(Value(needle)))
+    ).filter(match_position__gt=0).annotate(
+        snippet=Substr(
+            'content',
+            Greatest(F('match_position') - SNIPPET_RADIUS, Value(1)),
+            SNIPPET_RADIUS * 2 + len(needle),
+        )
+    )
+    words = sorted(
+        {term.text if term.phrase else word for term in terms for word in term.words},
+        key=len,
+        reverse=True,
+    )
+    return {
+        document_id: _highlight(' '.join(snippet.split()), words)
+        for document_id, snippet in contents.values_list('document_id', 'snippet')
+    }
+
+
+def plain_search_text(query):
+    """Return the words of the non-excluded terms of a search string"""
+    return ' '.join(
+        word
+        for term in parse_search_terms(query)
+        if not term.negated
+        for word in term.words
+    )
+
+
+def _fallback_similarity(value, candidate, word):
+    ratios = [SequenceMatcher(None, value, candidate).ratio()]
+    if word:
+        ratios.extend(
+            SequenceMatcher(None, value, candidate_word).ratio()
+            for candidate_word in WORD_PATTERN.findall(candidate)
+        )
+    return max(ratios)
+
+
+def suggest_similar(documents, field, value, word=False, limit=SUGGESTION_LIMIT):
+    """Return up to ``limit`` values of ``field`` that look like ``value``.
+
+    On PostgreSQL candidates are matched with pg_trgm against the same
+    ``UPPER(field::text)`` expression the trigram indexes are built on, and
+    ranked by similarity; ``word`` compares ``value`` with the closest word
+    run of each candidate instead of the whole string, which suits titles.
+    Other databases score a bounded set of distinct values with difflib.
+    """
+    value = (value or '').strip()
+    if not value:
+        return []
+    documents = documents.order_by().exclude(**{f'{field}__iexact': value})
+
+    if is_postgresql():
+        lookup = 'trigram_word_similar' if word else 'trigram_similar'
+        expression = Upper(Cast(field, output_field=TextField()))
+        similarity = (
+            TrigramWordSimilarity(Value(value.upper()), expression)
+            if word else TrigramSimilarity(expression, Value(value.upper()))
+        )
+        matches = documents.annotate(
+            suggestion_match=expression,
+        ).filter(
+            **{f'suggestion_match__{lookup}': value.upper()}
+        ).values(field).annotate(
+            similarity=Max(similarity),
+        ).order_by('-similarity', field)[:limit]
+        return [match[field] for match in matches]
+
+    candidates = documents.values_list(field, flat=True).distinct()[:SUGGESTION_CANDIDATE_LIMIT]
+    needle = value.lower()
+    scored = {}
+    for candidate in candidates:
+        if not candidate or candidate.lower() in scored:
+            continue
+        scored[candidate.lower()] = (
+            _fallback_similarity(needle, candidate.lower(), word),
+            candidate,
+        )
+    ranked = sorted(
+        (entry for entry in scored.values() if entry[0] >= SUGGESTION_FALLBACK_CUTOFF),
+        key=lambda entry: (-entry[0], entry[1]),
+    )
+    return [candidate for _score, candidate in ranked[:limit]]
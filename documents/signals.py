@@ -0,0 +1,76 @@
+import os
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .access import sync_document_access
+from .blobs import release_blob, store_blob
+from .models import Document, DocumentAccess
+from .tags import sync_document_tags
+
+
+@receiver(pre_save, sender=Document)
+def store_file_as_blob(sender, instance, **kwargs):
+    """Store a newly assigned file as a deduplicated blob instead of under
+    its upload path"""
+    if not instance.file or instance.file._committed:
+        return
+    uploaded = instance.file.file
+    blob = store_blob(uploaded, instance.file_type)
+    # Lets Document.save() undo this if the row is not saved
+    instance._stored_blob = (blob.sha256, blob.name, instance.file, instance.blob_id)
+    instance._replaced_blob_id = instance.blob_id
+    instance.blob = blob
+    instance.file = blob.name
+    instance.file_name = os.path.basename(uploaded.name)
+    instance.file_hash = blob.sha256
+
+
+@receiver(post_save, sender=Document)
+def release_replaced_blob(sender, instance, **kwargs):
+    """Drop the reference to the blob a saved document no longer uses"""
+    instance.__dict__.pop('_stored_blob', None)
+    blob_id = instance.__dict__.pop('_replaced_blob_id', None)
+    if blob_id is not None and blob_id != instance.blob_id:
+        release_blob(blob_id)
+
+
+@receiver(post_delete, sender=Document)
+def release_blob_on_delete(sender, instance, **kwargs):
+    if instance.blob_id is not None:
+        release_blob(instance.blob_id)
+
+
+@receiver(post_save, sender=Document)
+def sync_tags_on_save(sender, instance, created, update_fields=None, **kwargs):
+    """Keep the normalized tag links in step with ``Document.tags``"""
+    if update_fields is not None and 'tags' not in update_fields:
+        return
+    if created and not instance.tags:
+        return
+    sync_document_tags(instance)
+
+
+@receiver(post_save, sender=Document)
+def sync_access_on_save(sender, instance, created, update_fields=None, **kwargs):
+    """Grant the owner access and follow ownership changes"""
+    if created:
+        DocumentAccess.objects.get_or_create(user_id=instance.owner_id, document=instance)
+    elif update_fields is None or 'owner' in update_fields:
+        sync_document_access([instance.pk])
+
+
+@receiver(m2m_changed, sender=Document.shared_with.through)
+def sync_access_on_share(sender, instance, action, reverse, pk_set, **kwargs):
+    """Mirror ``shared_with`` changes made from either side of the relation"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        sync_document_access([instance.pk])
+    elif action == 'post_clear':
+        # The cleared documents are no longer linked, but their grants still are
+        sync_document_access(
+            DocumentAccess.objects.filter(user=instance).values_list('document_id', flat=True)
+        )
+    else:
+        sync_document_access(pk_set)
@@ -0,0 +1,53 @@
+from django.db.models import Count
+
+from .models import DocumentTag, Tag
+
+
+TAG_MAX_LENGTH = Tag._meta.get_field('name').max_length
+TAG_FACET_LIMIT = 20
+
+
+def normalize_tag(name):
+    """Return the canonical form of a tag: trimmed, lowercase, single-spaced"""
+    return ' '.join((name or '').split()).lower()[:TAG_MAX_LENGTH].strip()
+
+
+def parse_tags(value):
+    """Split a comma-separated tag string into unique normalized names"""
+    names = []
+    for part in (value or '').split(','):
+        name = normalize_tag(part)
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def sync_document_tags(document):
+    """Make a document's Tag links match its comma-separated ``tags`` field"""
+    names = parse_tags(document.tags)
+    DocumentTag.objects.filter(document=document).exclude(tag__name__in=names).delete()
+    if not names:
+        return
+
+    Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+    linked = set(
+        DocumentTag.objects.filter(document=document).values_list('tag__name', flat=True)
+    )
+    DocumentTag.objects.bulk_create(
+        [
+            DocumentTag(document=document, tag=tag)
+            for tag in Tag.objects.filter(name__in=names)
+            if tag.name not in linked
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def tag_counts(documents, limit=TAG_FACET_LIMIT):
+    """Return ``[(tag, count), ...]`` for a document queryset in one grouped query"""
+    counts = DocumentTag.objects.filter(
+        document__in=documents.order_by().values('pk')
+    ).values('tag__name').annotate(
+        total=Count('document_id')
+    ).order_by('-total', 'tag__name')[:limit]
+    return [(entry['tag__name'], entry['total']) for entry in counts]
@@ -0,0 +1,39 @@
+from django.utils import timezone
+
+from jobs.queue import enqueue, task
+
+from .artifacts import build_document_preview
+from .extraction import extract_document_content, refresh_file_hash
+from .models import Document, UploadSession
+from .thumbnails import ThumbnailError, generate_thumbnails
+from .upload_sessions import delete_session
+
+
+@task('documents.process_upload')
+def process_upload(document_id):
+    """Extract searchable text and render the stored preview and thumbnails of an upload"""
+    document = Document.objects.filter(pk=document_id).first()
+    if document is None or not document.file:
+        return
+    extract_document_content(document)
+    build_document_preview(document)
+    if document.has_thumbnail:
+        file_hash = document.file_hash or refresh_file_hash(document)
+        try:
+            generate_thumbnails(document.file.path, document.get_file_extension(), file_hash)
+        except ThumbnailError:
+            # Served without a thumbnail; the endpoint answers 404
+            pass
+
+
+@task('documents.expire_upload_session')
+def expire_upload_session(session_id):
+    """Delete an abandoned upload session and its temporary file"""
+    session = UploadSession.objects.filter(pk=session_id).first()
+    if session is None:
+        return
+    if session.expires_at > timezone.now():
+        # Chunks arrived since this job was queued; check again at the new expiry
+        enqueue('documents.expire_upload_session', run_after=session.expires_at, session_id=session_id)
+        return
+    delete_session(session)
@@ -0,0 +1,145 @@
+"""Thumbnails for image and PDF documents, and rendered PDF pages.
+
+Thumbnails are stored under ``MEDIA_ROOT/thumbnails`` and named by the
+SHA-256 of the source file and the size, so identical files share
+thumbnails and a changed file gets new ones without any invalidation. PDF
+pages are rasterized with ``pdftoppm`` (poppler-utils) when it is
+installed; without it PDFs have no thumbnail and no page images. Page
+images are stored the same way under ``MEDIA_ROOT/pages``, one per page
+as it is first requested.
+"""
+import functools
+import os
+import shutil
+import subprocess
+import tempfile
+
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+THUMBNAIL_SIZES = {
+    'small': 64,
+    'medium': 320,
+    'large': 1024,
+}
+THUMBNAIL_FORMAT = 'WEBP'
+THUMBNAIL_CONTENT_TYPE = 'image/webp'
+THUMBNAIL_QUALITY = 80
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+PDF_RENDER_TIMEOUT = 30  # seconds
+PDF_PAGE_IMAGE_SIZE = 1600  # pixels on the longer edge, about 140 dpi for A4
+
+
+class ThumbnailError(Exception):
+    """Raised when a thumbnail cannot be generated."""
+
+
+@functools.lru_cache(maxsize=None)
+def pdf_renderer():
+    """Return the path of the local PDF rasterizer, or None.
+
+    PATH is searched once per process, as list pages ask for every PDF row;
+    restart the processes after installing poppler-utils.
+    """
+    return shutil.which('pdftoppm')
+
+
+def supports_thumbnail(extension):
+    if extension in IMAGE_EXTENSIONS:
+        return True
+    return extension == '.pdf' and pdf_renderer() is not None
+
+
+def thumbnail_path(file_hash, size):
+    return os.path.join(
+        settings.MEDIA_ROOT, 'thumbnails', file_hash[:2], f'{file_hash}-{size}.webp'
+    )
+
+
+def pdf_page_path(file_hash, page):
+    return os.path.join(
+        settings.MEDIA_ROOT, 'pages', file_hash[:2], f'{file_hash}-p{page}.webp'
+    )
+
+
+def _render_pdf_page(file_path, directory, page=1, scale_to=max(THUMBNAIL_SIZES.values())):
+    """Rasterize one 1-based PDF page to a PNG in ``directory``"""
+    renderer = pdf_renderer()
+    if renderer is None:
+        raise ThumbnailError('No PDF renderer is installed.')
+    output_prefix = os.path.join(directory, 'page')
+    try:
+        subprocess.run(
+            [
+                renderer, '-f', str(page), '-l', str(page), '-singlefile', '-png',
+                '-scale-to', str(scale_to),
+                file_path, output_prefix,
+            ],
+            check=True,
+            capture_output=True,
+            timeout=PDF_RENDER_TIMEOUT,
+        )
+    except (OSError, subprocess.SubprocessError) as exc:
+        raise ThumbnailError(f'Unable to render PDF page {page}.') from exc
+    return f'{output_prefix}.png'
+
+
+def _save_atomically(image, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            image.save(file, THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def generate_thumbnails(file_path, extension, file_hash):
+    """Write every thumbnail size of a file and return ``{size: path}``"""
+    largest = max(THUMBNAIL_SIZES.values())
+    paths = {}
+    with tempfile.TemporaryDirectory() as directory:
+        source = file_path
+        if extension == '.pdf':
+            source = _render_pdf_page(file_path, directory)
+        try:
+            with Image.open(source) as image:
+                # Let the JPEG decoder downscale while decoding large photos
+                image.draft('RGB', (largest, largest))
+                thumbnail = ImageOps.exif_transpose(image)
+                if thumbnail.mode not in ('RGB', 'RGBA'):
+                    thumbnail = thumbnail.convert('RGBA')
+                # Shrink from the largest size down, reusing each result
+                for size, edge in sorted(THUMBNAIL_SIZES.items(), key=lambda item: -item[1]):
+                    thumbnail.thumbnail((edge, edge))
+                    paths[size] = thumbnail_path(file_hash, size)
+                    _save_atomically(thumbnail, paths[size])
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError) as exc:
+            raise ThumbnailError('Unable to read image for thumbnail.') from exc
+    return paths
+
+
+def get_thumbnail(file_path, extension, file_hash, size):
+    """Return the path of a thumbnail, generating the thumbnails if missing"""
+    path = thumbnail_path(file_hash, size)
+    if not os.path.exists(path):
+        path = generate_thumbnails(file_path, extension, file_hash)[size]
+    return path
+
+
+def get_pdf_page_image(file_path, file_hash, page):
+    """Return the path of a rendered PDF page, rendering it if missing"""
+    path = pdf_page_path(file_hash, page)
+    if os.path.exists(path):
+        return path
+    with tempfile.TemporaryDirectory() as directory:
+        source = _render_pdf_page(file_path, directory, page, scale_to=PDF_PAGE_IMAGE_SIZE)
+        try:
+            with Image.open(source) as image:
+                _save_atomically(image.convert('RGB'), path)
+        except (UnidentifiedImageError, OSError, ValueError) as exc:
+            raise ThumbnailError(f'Unable to read rendered PDF page {page}.') from exc
+    return path
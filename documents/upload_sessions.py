@@ -0,0 +1,241 @@
+"""Resumable, chunked uploads for files too large for a single request.
+
+A client opens an ``UploadSession`` with the document's metadata and the
+file's size, then sends the file in fixed-size chunks, each tagged with
+the offset it starts at. Chunks are appended to a temporary file and only
+a chunk that starts at the acknowledged offset is accepted, so a client
+whose connection dropped asks for the session's offset and carries on
+from there. Chunks get the same content checks as single-request uploads
+(see ``uploads.py``). Completing the session creates the ``Document`` in one
+transaction, storing the file as a blob like any other upload.
+
+The SHA-256 of the received bytes is updated as chunks arrive. The digest
+lives in the memory of the process that received the chunks; a chunk or
+completion handled by another process first re-hashes the bytes already
+on disk. Sessions that are neither completed nor touched for
+``UPLOAD_SESSION_EXPIRY`` seconds are deleted with their temporary files
+by the ``documents.expire_upload_session`` job queued for each session,
+and by ``purge_upload_sessions``.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from jobs.queue import enqueue
+from .blobs import discard_blob_file
+from .models import Document, UploadSession
+from .uploads import SNIFF_BYTES, UploadRejected, check_archive, check_head, check_text
+
+
+WRITE_BLOCK_SIZE = 64 * 1024
+HASHER_CACHE_SIZE = 64
+
+
+class UploadError(Exception):
+    """A chunk or completion that cannot be accepted.
+
+    ``status`` is the HTTP status to answer with and ``offset`` the number
+    of bytes the session has acknowledged, which the client resumes from.
+    """
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+
+def _cached_hasher(session_id, offset):
+    """Return the running digest of a session's first ``offset`` bytes if
+    this process received them"""
+    with _hashers_lock:
+        entry = _hashers.pop(session_id, None)
+    if entry is not None and entry[0] == offset:
+        return entry[1]
+    return None
+
+
+def _cache_hasher(session_id, offset, hasher):
+    with _hashers_lock:
+        _hashers[session_id] = (offset, hasher)
+        while len(_hashers) > HASHER_CACHE_SIZE:
+            _hashers.popitem(last=False)
+
+
+def _hash_prefix(path, length):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while length > 0:
+            block = file.read(min(WRITE_BLOCK_SIZE, length))
+            if not block:
+                break
+            hasher.update(block)
+            length -= len(block)
+    return hasher
+
+
+def _expiry():
+    return timezone.now() + timedelta(seconds=settings.UPLOAD_SESSION_EXPIRY)
+
+
+def create_session(owner, filename, content_type, size, metadata):
+    """Open an upload session with an empty temporary file"""
+    os.makedirs(settings.UPLOAD_SESSION_DIR, exist_ok=True)
+    session = UploadSession.objects.create(
+        owner=owner,
+        filename=os.path.basename(filename),
+        content_type=content_type,
+        size=size,
+        metadata=metadata,
+        expires_at=_expiry(),
+    )
+    open(session.path, 'wb').close()
+    enqueue('documents.expire_upload_session', run_after=session.expires_at, session_id=str(session.pk))
+    return session
+
+
+def append_chunk(session, offset, length, stream):
+    """Append ``length`` bytes read from ``stream`` at ``offset`` and return
+    the session with its new offset.
+
+    Chunks are ``UPLOAD_SESSION_CHUNK_SIZE`` bytes, except the last one.
+    A chunk that does not start at the acknowledged offset, or that breaks
+    off early, is rejected and leaves the session unchanged.
+    """
+    with transaction.atomic():
+        # The lock keeps two requests from writing the same session at once
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        expected = min(settings.UPLOAD_SESSION_CHUNK_SIZE, session.size - session.offset)
+        if offset != session.offset:
+            raise UploadError(
+                f'Expected a chunk at byte {session.offset}.', status=409, offset=session.offset
+            )
+        if length != expected or not expected:
+            raise UploadError(
+                f'Expected a chunk of {expected} bytes.', offset=session.offset
+            )
+
+        hasher = _cached_hasher(session.pk, offset) or _hash_prefix(session.path, offset)
+        received = 0
+        with open(session.path, 'r+b') as file:
+            # Bytes past the offset are from a chunk that was never acknowledged
+            file.truncate(offset)
+            file.seek(offset)
+            try:
+                while received < length:
+                    block = stream.read(min(WRITE_BLOCK_SIZE, length - received))
+                    if not block:
+                        break
+                    if not offset and not received:
+                        check_head(session.content_type, block[:SNIFF_BYTES])
+                    check_text(session.content_type, block)
+                    file.write(block)
+                    hasher.update(block)
+                    received += len(block)
+            except UploadRejected as exc:
+                file.truncate(offset)
+                raise UploadError(str(exc), status=415, offset=offset) from exc
+            if received != length:
+                file.truncate(offset)
+                raise UploadError('The chunk ended early.', offset=offset)
+            file.flush()
+            os.fsync(file.fileno())
+
+        session.offset += length
+        session.expires_at = _expiry()
+        session.save(update_fields=['offset', 'expires_at'])
+    _cache_hasher(session.pk, session.offset, hasher)
+    return session
+
+
+def complete_session(session, sha256=''):
+    """Create the session's document from the received file and close the
+    session.
+
+    ``sha256`` is the client's digest of the whole file; when given it must
+    match the bytes received.
+    """
+    document = None
+    try:
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(pk=session.pk)
+            if session.offset != session.size:
+                raise UploadError(
+                    f'Only {session.offset} of {session.size} bytes were received.',
+                    status=409,
+                    offset=session.offset,
+                )
+            hasher = _cached_hasher(session.pk, session.offset) or _hash_prefix(session.path, session.size)
+            digest = hasher.hexdigest()
+            if sha256 and sha256.lower() != digest:
+                raise UploadError('The file does not match its checksum.', offset=session.offset)
+
+            with open(session.path, 'rb') as file:
+                try:
+                    check_archive(session.content_type, file)
+                except UploadRejected as exc:
+                    raise UploadError(str(exc), status=415, offset=session.offset) from exc
+                content = File(file, name=session.filename)
+                content.sha256 = digest
+                document = Document(
+                    owner=session.owner,
+                    file=content,
+                    file_size=session.size,
+                    file_type=session.content_type,
+                    **session.metadata,
+                )
+                document.save()
+            path = session.path
+            session.delete()
+            transaction.on_commit(lambda: _remove(path))
+    except BaseException:
+        # The rollback took the new blob's row but not the file written for it
+        if document is not None and document.blob_id is not None:
+            discard_blob_file(document.file_hash, document.file.name)
+        raise
+    return document
+
+
+def delete_session(session):
+    path = session.path
+    session.delete()
+    transaction.on_commit(lambda: _remove(path))
+
+
+def purge_expired_sessions(now=None):
+    """Delete expired sessions and temporary files no session owns; return
+    the number of each removed"""
+    now = now or timezone.now()
+    expired = 0
+    for session in UploadSession.objects.filter(expires_at__lte=now).iterator():
+        delete_session(session)
+        expired += 1
+
+    orphaned = 0
+    directory = settings.UPLOAD_SESSION_DIR
+    if os.path.isdir(directory):
+        cutoff = (now - timedelta(seconds=settings.UPLOAD_SESSION_EXPIRY)).timestamp()
+        live = {f'{pk}.part' for pk in UploadSession.objects.values_list('pk', flat=True)}
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name not in live and os.path.getmtime(path) < cutoff:
+                _remove(path)
+                orphaned += 1
+    return expired, orphaned
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
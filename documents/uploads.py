@@ -0,0 +1,184 @@
+"""Upload handlers that check files while they stream in.
+
+They behave like Django's memory and temporary-file handlers, but each
+chunk is checked before it is stored: the declared content type must be
+allowed, the first bytes must carry that type's signature, text must not
+contain NUL bytes, and the file must stay within the upload limit. A file
+that fails is dropped before anything more of it is written, and a request
+too large to hold an acceptable file is not read any further. Word and
+Excel (OOXML) files are zip archives, so their central directory is
+checked for the document's main part once the file is complete.
+
+The same pass counts the size and computes the SHA-256, attached to the
+uploaded file as ``sha256`` so ``store_blob`` does not read it again.
+Files rejected while streaming are missing from ``request.FILES`` and
+their reasons are kept in ``request.upload_errors`` by field name; files
+rejected on completion carry the reason as ``upload_error``.
+"""
+import hashlib
+import zipfile
+
+from django.conf import settings
+from django.core.files.uploadhandler import (
+    MemoryFileUploadHandler,
+    SkipFile,
+    StopUpload,
+    TemporaryFileUploadHandler,
+)
+
+
+PDF_SIGNATURE = b'%PDF-'
+OLE_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'  # legacy .doc and .xls
+ZIP_SIGNATURE = b'PK\x03\x04'
+# Leading bytes each allowed content type must start with
+CONTENT_SIGNATURES = {
+    'application/pdf': PDF_SIGNATURE,
+    'application/msword': OLE_SIGNATURE,
+    'application/vnd.ms-excel': OLE_SIGNATURE,
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': ZIP_SIGNATURE,
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': ZIP_SIGNATURE,
+    'image/jpeg': b'\xff\xd8\xff',
+    'image/png': b'\x89PNG\r\n\x1a\n',
+}
+# Part every OOXML package of the type must contain
+OOXML_MAIN_PARTS = {
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': 'word/document.xml',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': 'xl/workbook.xml',
+}
+TEXT_CONTENT_TYPE = 'text/plain'
+SNIFF_BYTES = max(len(signature) for signature in CONTENT_SIGNATURES.values())
+# Room for the other form fields and multipart framing in an upload request
+MULTIPART_ALLOWANCE = 1024 * 1024
+
+
+class UploadRejected(Exception):
+    """A file whose content is not allowed or does not match its type"""
+
+
+def check_content_type(content_type):
+    if content_type not in settings.ALLOWED_DOCUMENT_TYPES:
+        raise UploadRejected(
+            f'File type {content_type} is not allowed. Allowed types: PDF, Word, Excel, Text, Images'
+        )
+
+
+def check_head(content_type, head):
+    """Check the first ``SNIFF_BYTES`` of a file against its declared type"""
+    signature = CONTENT_SIGNATURES.get(content_type)
+    if signature is not None and not head.startswith(signature):
+        raise UploadRejected(f'The file content is not a valid {content_type} file.')
+    if signature is None and any(head.startswith(known) for known in CONTENT_SIGNATURES.values()):
+        raise UploadRejected(f'The file content does not match its type {content_type}.')
+
+
+def check_text(content_type, chunk):
+    if content_type == TEXT_CONTENT_TYPE and b'\0' in chunk:
+        raise UploadRejected('The file content is not text.')
+
+
+def check_archive(content_type, file):
+    """Check the central directory of an OOXML file for its main part"""
+    main_part = OOXML_MAIN_PARTS.get(content_type)
+    if main_part is None:
+        return
+    try:
+        with zipfile.ZipFile(file) as archive:
+            names = set(archive.namelist())
+    except (zipfile.BadZipFile, OSError, ValueError):
+        names = set()
+    finally:
+        file.seek(0)
+    if '[Content_Types].xml' not in names or main_part not in names:
+        raise UploadRejected(f'The file content is not a valid {content_type} file.')
+
+
+def check_size(size):
+    if size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+        raise UploadRejected(
+            f'File size must not exceed {settings.FILE_UPLOAD_MAX_MEMORY_SIZE / (1024*1024)}MB'
+        )
+
+
+class ContentSniffer:
+    """Checks, sizes and hashes one file as its chunks arrive"""
+
+    def __init__(self, content_type):
+        check_content_type(content_type)
+        self.content_type = content_type
+        self.size = 0
+        self.digest = hashlib.sha256()
+        self._head = b''
+        self._checked_head = False
+
+    def update(self, chunk):
+        self.size += len(chunk)
+        check_size(self.size)
+        if not self._checked_head:
+            self._head += chunk[:SNIFF_BYTES - len(self._head)]
+            if len(self._head) >= SNIFF_BYTES:
+                check_head(self.content_type, self._head)
+                self._checked_head = True
+        check_text(self.content_type, chunk)
+        self.digest.update(chunk)
+
+    def finish(self, file):
+        """Run the checks that need the whole file and return its SHA-256"""
+        if not self._checked_head:
+            check_head(self.content_type, self._head)
+        check_archive(self.content_type, file)
+        return self.digest.hexdigest()
+
+
+class CheckedUploadMixin:
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.request_length = content_length
+        return super().handle_raw_input(input_data, META, content_length, boundary, encoding)
+
+    def new_file(self, field_name, file_name, content_type, content_length, *args, **kwargs):
+        try:
+            self.sniffer = ContentSniffer(content_type)
+        except UploadRejected as exc:
+            self._reject(field_name, exc)
+            raise SkipFile from exc
+        try:
+            if content_length is not None:
+                check_size(content_length)
+            check_size(getattr(self, 'request_length', 0) - MULTIPART_ALLOWANCE)
+        except UploadRejected as exc:
+            self._reject(field_name, exc)
+            # Stop reading the request rather than receive a file only to discard it
+            raise StopUpload(connection_reset=True) from exc
+        super().new_file(field_name, file_name, content_type, content_length, *args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        # The memory handler leaves files over its limit to the next handler
+        if getattr(self, 'activated', True):
+            try:
+                self.sniffer.update(raw_data)
+            except UploadRejected as exc:
+                self._reject(self.field_name, exc)
+                raise SkipFile from exc
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            try:
+                file.sha256 = self.sniffer.finish(file)
+            except UploadRejected as exc:
+                file.upload_error = str(exc)
+        return file
+
+    def _reject(self, field_name, exc):
+        if self.request is not None:
+            if not hasattr(self.request, 'upload_errors'):
+                self.request.upload_errors = {}
+            self.request.upload_errors[field_name] = str(exc)
+
+
+class CheckedMemoryFileUploadHandler(CheckedUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class CheckedTemporaryFileUploadHandler(CheckedUploadMixin, TemporaryFileUploadHandler):
+    pass
@@ -5,11 +5,19 @@ app_name = 'documents'
 
 urlpatterns = [
     path('', views.document_list, name='document_list'),
+    path('sections/<str:section>/', views.document_section, name='document_section'),
     path('folders/new/', views.folder_create, name='folder_create'),
     path('folders/<int:pk>/edit/', views.folder_update, name='folder_update'),
+    path('download/', views.document_bulk_download, name='document_bulk_download'),
     path('upload/', views.document_upload, name='document_upload'),
+    path('uploads/', views.upload_session_create, name='upload_session_create'),
+    path('uploads/<uuid:session_id>/', views.upload_session, name='upload_session'),
+    path('uploads/<uuid:session_id>/complete/', views.upload_session_complete, name='upload_session_complete'),
     path('<int:pk>/', views.document_detail, name='document_detail'),
     path('<int:pk>/preview/', views.document_preview, name='document_preview'),
+    path('<int:pk>/thumbnail/<str:size>/', views.document_thumbnail, name='document_thumbnail'),
+    path('<int:pk>/spreadsheet/', views.document_spreadsheet_window, name='document_spreadsheet_window'),
+    path('<int:pk>/pages/', views.document_pdf_page, name='document_pdf_page'),
     path('<int:pk>/download/', views.document_download, name='document_download'),
     path('<int:pk>/update/', views.document_update, name='document_update'),
     path('<int:pk>/delete/', views.document_delete, name='document_delete'),
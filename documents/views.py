@@ -1,42 +1,87 @@
 import os
-import re
-from collections import defaultdict
 from urllib.parse import quote
 
 from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import FileResponse, Http404
+from django.core.exceptions import PermissionDenied
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.views.decorators.clickjacking import xframe_options_sameorigin
-from django.db.models import Q, Count
+from django.views.decorators.http import require_http_methods, require_POST
 from django.utils import timezone
-from .models import Document, DocumentFolder
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header
+from .models import Document, DocumentFolder, UploadSession
 from .forms import (
     DocumentUploadForm,
     DocumentUpdateForm,
     DocumentSearchForm,
     DocumentFolderForm,
+    UploadSessionForm,
+)
+from .pagination import InvalidCursor, paginate_keyset
+from .previews import (
+    PDF_PREVIEW_PAGE_LIMIT,
+    PREVIEW_CHAR_LIMIT,
+    PREVIEW_COLUMN_LIMIT,
+    PREVIEW_MAX_FILE_SIZE,
+    PREVIEW_ROW_LIMIT,
+    PreviewError,
+    load_pdf_page,
+    load_spreadsheet_window,
+)
+from .preview_cache import preview_cache
+from .sandbox import run_sandboxed
+from .artifacts import STORED_PREVIEW_EXTENSIONS, get_document_preview
+from .extraction import refresh_file_hash
+from .thumbnails import (
+    THUMBNAIL_CONTENT_TYPE,
+    THUMBNAIL_SIZES,
+    ThumbnailError,
+    get_pdf_page_image,
+    get_thumbnail,
+    pdf_renderer,
 )
+from .archives import stream_zip
+from .facets import facet_counts
+from .file_serving import serve_file
+from .upload_sessions import UploadError, append_chunk, complete_session, create_session, delete_session
+from .tags import normalize_tag, tag_counts
+from .search import content_snippets, plain_search_text, search_documents, suggest_similar
 from .permissions import can_access_document, get_accessible_documents, can_manage_folders
 from accounts.utils import log_audit
-from accounts.decorators import manager_or_admin_required
-from docx import Document as DocxDocument
-from docx.opc.exceptions import PackageNotFoundError
-from openpyxl import load_workbook
-from openpyxl.utils.exceptions import InvalidFileException
-
-
-PREVIEW_CHAR_LIMIT = 8000
-PREVIEW_ROW_LIMIT = 25
-PREVIEW_COLUMN_LIMIT = 10
-PREVIEW_CELL_LIMIT = 200
-PREVIEW_MAX_FILE_SIZE = 5 * 1024 * 1024
-CONTROL_CHAR_PATTERN = re.compile(r'[\x00-\x1F\x7F]')
-
-
-class PreviewError(Exception):
-    """Raised when a preview cannot be generated."""
+from accounts.decorators import capability_required, manager_or_admin_required
+from accounts.models import Role
+from jobs.queue import enqueue
+
+
+DOCUMENT_LIST_PAGE_SIZE = 25
+THUMBNAIL_CACHE_SECONDS = 365 * 24 * 60 * 60
+PREVIEW_RETRY_SECONDS = 5
+DOCUMENT_LIST_ORDERING = ('-created_at', 'id')
+DOCUMENT_SEARCH_ORDERING = ('-search_rank', '-created_at', 'id')
+DOCUMENT_FACET_VALUE_LIMIT = 10
+# (facet field, form field, label, value labels) for the facet sidebar
+DOCUMENT_FACET_FILTERS = (
+    ('classification', 'classification', 'Classification', dict(Document.CLASSIFICATION_CHOICES)),
+    ('owner__username', 'owner', 'Owner', {}),
+    ('category', 'category', 'Category', {}),
+)
+# (form field, document field, label, match whole words) for "did you mean"
+DOCUMENT_SUGGESTION_FIELDS = (
+    ('query', 'title', 'Title', True),
+    ('category', 'category', 'Category', False),
+    ('owner', 'owner__username', 'Owner', False),
+)
 
 
 def _render_document_detail(request, document, preview_type, preview_context):
@@ -55,97 +100,30 @@ def _is_safe_media_path(file_path):
         return False
 
 
-def _truncate_text(text, limit=PREVIEW_CHAR_LIMIT):
-    if not text:
-        return '', False
-    truncated = len(text) > limit
-    return text[:limit], truncated
+def _file_etag(document):
+    """Strong validator for the document's file, from its SHA-256"""
+    return f'"{document.file_hash or refresh_file_hash(document)}"'
 
 
-def _load_text_preview(file_path):
-    try:
-        with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
-            content = file.read(PREVIEW_CHAR_LIMIT + 1)
-    except (OSError, UnicodeError) as exc:
-        raise PreviewError('Unable to read text preview.') from exc
-    return _truncate_text(content)
-
-
-def _load_docx_preview(file_path):
-    try:
-        doc = DocxDocument(file_path)
-    except (PackageNotFoundError, OSError, ValueError) as exc:
-        raise PreviewError('Unable to read Word document preview.') from exc
-    content = '\n'.join(
-        paragraph.text for paragraph in doc.paragraphs if paragraph.text
+def _accessible_documents(user):
+    return Document.objects.select_related('owner').filter(
+        get_accessible_documents(user),
+        is_archived=False
     )
-    return _truncate_text(content)
 
 
-def _load_spreadsheet_preview(file_path):
-    workbook = None
-    sheet_title = ''
-    rows = []
-    truncated = False
-    try:
-        workbook = load_workbook(file_path, read_only=True, data_only=True)
-        sheet = workbook.active
-        for row_index, row in enumerate(sheet.iter_rows(
-            values_only=True,
-            max_row=PREVIEW_ROW_LIMIT + 1,
-            max_col=PREVIEW_COLUMN_LIMIT + 1,
-        )):
-            if row_index >= PREVIEW_ROW_LIMIT:
-                truncated = True
-                break
-            row_values = []
-            if len(row) > PREVIEW_COLUMN_LIMIT:
-                truncated = True
-            for cell in row[:PREVIEW_COLUMN_LIMIT]:
-                if cell is None:
-                    row_values.append('')
-                    continue
-                try:
-                    cell_value = str(cell)
-                except (TypeError, ValueError):
-                    truncated = True
-                    cell_value = ''
-                cell_value = CONTROL_CHAR_PATTERN.sub('', cell_value)
-                if len(cell_value) > PREVIEW_CELL_LIMIT:
-                    truncated = True
-                    cell_value = f'{cell_value[:PREVIEW_CELL_LIMIT]}…'
-                row_values.append(cell_value)
-            rows.append(row_values)
-        sheet_title = sheet.title
-    except (InvalidFileException, OSError, ValueError) as exc:
-        raise PreviewError('Unable to read spreadsheet preview.') from exc
-    finally:
-        if workbook is not None:
-            workbook.close()
-
-    return sheet_title, rows, truncated
-
+def _filter_documents(user, form):
+    """Return the accessible, non-archived documents matching the search form
+    together with the keyset ordering to page them by"""
+    documents = _accessible_documents(user)
+    ordering = DOCUMENT_LIST_ORDERING
 
-@login_required
-def document_list(request):
-    """List documents with search and filter"""
-    form = DocumentSearchForm(request.GET)
-    
-    # Get base queryset with access control - exclude archived documents
-    documents = Document.objects.select_related('owner').filter(
-        get_accessible_documents(request.user),
-        is_archived=False
-    ).distinct()
-    
-    # Apply search filters
     if form.is_valid():
         query = form.cleaned_data.get('query')
         if query:
-            documents = documents.filter(
-                Q(title__icontains=query) | 
-                Q(description__icontains=query) |
-                Q(file__icontains=query)
-            )
+            documents, ranked = search_documents(documents, query)
+            if ranked:
+                ordering = DOCUMENT_SEARCH_ORDERING
         
         classification = form.cleaned_data.get('classification')
         if classification:
@@ -158,6 +136,10 @@ def document_list(request):
         category = form.cleaned_data.get('category')
         if category:
             documents = documents.filter(category__icontains=category)
+
+        tag = normalize_tag(form.cleaned_data.get('tag'))
+        if tag:
+            documents = documents.filter(document_tags__tag__name=tag)
         
         owner = form.cleaned_data.get('owner')
         if owner:
@@ -171,38 +153,125 @@ def document_list(request):
         if date_to:
             documents = documents.filter(created_at__lte=date_to)
 
-    documents = documents.order_by('section', '-created_at')
-    documents_count = documents.count()
+    return documents, ordering
+
+
+def _attach_snippets(documents, form):
+    """Attach highlighted file-content snippets to a page of search results"""
+    query = form.cleaned_data.get('query') if form.is_valid() else ''
+    if not query or not documents:
+        return
+    snippets = content_snippets([document.pk for document in documents], query)
+    for document in documents:
+        document.snippet = snippets.get(document.pk, '')
+
+
+def _filter_querystring(request):
+    """Return the current search filters as a query string without paging state"""
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    params.pop('section', None)
+    return params.urlencode()
+
+
+def _search_suggestions(request, form):
+    """Return "did you mean" links for the text filters of an empty search"""
+    if not form.is_valid():
+        return []
+    documents = _accessible_documents(request.user)
+    suggestions = []
+    for param, field, label, word in DOCUMENT_SUGGESTION_FIELDS:
+        value = form.cleaned_data.get(param)
+        if param == 'query':
+            value = plain_search_text(value)
+        if not value:
+            continue
+        for suggestion in suggest_similar(documents, field, value, word=word):
+            params = request.GET.copy()
+            params.pop('cursor', None)
+            params[param] = suggestion
+            suggestions.append({
+                'label': label,
+                'value': suggestion,
+                'querystring': params.urlencode(),
+            })
+    return suggestions
+
+
+def _facet_groups(request, facets):
+    """Return the classification, owner and category facets with filter links"""
+    groups = []
+    for field, param, label, choices in DOCUMENT_FACET_FILTERS:
+        options = []
+        ranked = sorted(facets[field].items(), key=lambda item: (-item[1], item[0] or ''))
+        for value, total in ranked[:DOCUMENT_FACET_VALUE_LIMIT]:
+            if not value:
+                continue
+            params = request.GET.copy()
+            params.pop('cursor', None)
+            params[param] = value
+            options.append({
+                'label': choices.get(value, value),
+                'count': total,
+                'querystring': params.urlencode(),
+            })
+        if options:
+            groups.append({'label': label, 'options': options})
+    return groups
+
+
+def _tag_facets(request, documents):
+    """Return per-tag counts for the filtered documents with filter links"""
+    facets = []
+    for name, total in tag_counts(documents):
+        params = request.GET.copy()
+        params.pop('cursor', None)
+        params['tag'] = name
+        facets.append({'name': name, 'count': total, 'querystring': params.urlencode()})
+    return facets
+
+
+@login_required
+def document_list(request):
+    """List documents with search and filter"""
+    form = DocumentSearchForm(request.GET)
+    documents, ordering = _filter_documents(request.user, form)
+
     folder_map = {folder.key: folder for folder in DocumentFolder.objects.order_by('name')}
-    section_counts = {
-        entry['section']: entry['total']
-        for entry in documents.values('section').annotate(total=Count('id'))
-    }
+    facets = facet_counts(documents)
+    section_counts = facets['section']
+    documents_count = sum(section_counts.values())
     section_labels = dict(Document.SECTION_CHOICES)
-    section_map = defaultdict(list)
-    for document in documents:
-        section_map[document.section].append(document)
 
+    section_keys = [key for key in folder_map if section_counts.get(key)]
+    section_keys += sorted(key for key in section_counts if key not in folder_map)
+
+    # Folder bodies are fetched on demand; only a filtered (or lone) folder is
+    # rendered expanded with its first page of documents.
+    selected_section = form.cleaned_data.get('section') if form.is_valid() else ''
+    filter_query = _filter_querystring(request)
     documents_by_section = []
-    used_sections = set()
-    for section_value, folder in folder_map.items():
-        section_documents = section_map.get(section_value, [])
-        if section_documents:
-            documents_by_section.append({
-                'label': folder.name,
-                'documents': section_documents
-            })
-            used_sections.add(section_value)
-
-    for section_value, section_documents in section_map.items():
-        if section_value not in used_sections:
-            documents_by_section.append({
-                'label': section_labels.get(
-                    section_value,
-                    section_value.replace('_', ' ').title()
-                ),
-                'documents': section_documents
-            })
+    for section_value in section_keys:
+        folder = folder_map.get(section_value)
+        entry = {
+            'key': section_value,
+            'label': folder.name if folder else section_labels.get(
+                section_value,
+                section_value.replace('_', ' ').title()
+            ),
+            'count': section_counts[section_value],
+            'expanded': section_value == selected_section or len(section_keys) == 1,
+            'documents': [],
+            'next_cursor': None,
+        }
+        if entry['expanded']:
+            entry['documents'], entry['next_cursor'] = paginate_keyset(
+                documents.filter(section=section_value),
+                ordering,
+                page_size=DOCUMENT_LIST_PAGE_SIZE,
+            )
+            _attach_snippets(entry['documents'], form)
+        documents_by_section.append(entry)
 
     folders = [
         {
@@ -217,6 +286,10 @@ def document_list(request):
     return render(request, 'documents/document_list.html', {
         'documents_by_section': documents_by_section,
         'documents_count': documents_count,
+        'filter_query': filter_query,
+        'suggestions': _search_suggestions(request, form) if not documents_count else [],
+        'tag_facets': _tag_facets(request, documents) if documents_count else [],
+        'facet_groups': _facet_groups(request, facets),
         'form': form,
         'folders': folders,
         'can_manage_folders': can_manage_folders(request.user)
@@ -224,7 +297,31 @@ def document_list(request):
 
 
 @login_required
-@manager_or_admin_required
+def document_section(request, section):
+    """Render one page of a folder's documents for lazy loading"""
+    form = DocumentSearchForm(request.GET)
+    documents, ordering = _filter_documents(request.user, form)
+    try:
+        page, next_cursor = paginate_keyset(
+            documents.filter(section=section),
+            ordering,
+            cursor=request.GET.get('cursor'),
+            page_size=DOCUMENT_LIST_PAGE_SIZE,
+        )
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid pagination cursor.')
+    _attach_snippets(page, form)
+
+    return render(request, 'documents/document_rows.html', {
+        'documents': page,
+        'next_cursor': next_cursor,
+        'section_key': section,
+        'filter_query': _filter_querystring(request),
+    })
+
+
+@login_required
+@capability_required(Role.MANAGE_FOLDERS)
 def folder_create(request):
     """Create a new document folder"""
     if request.method == 'POST':
@@ -251,7 +348,7 @@ def folder_create(request):
 
 
 @login_required
-@manager_or_admin_required
+@capability_required(Role.MANAGE_FOLDERS)
 def folder_update(request, pk):
     """Update a document folder"""
     folder = get_object_or_404(DocumentFolder, pk=pk)
@@ -284,7 +381,11 @@ def folder_update(request, pk):
 def document_upload(request):
     """Upload a new document"""
     if request.method == 'POST':
-        form = DocumentUploadForm(request.POST, request.FILES)
+        form = DocumentUploadForm(
+            request.POST,
+            request.FILES,
+            upload_errors=getattr(request, 'upload_errors', None),
+        )
         if form.is_valid():
             document = form.save(commit=False)
             document.owner = request.user
@@ -299,6 +400,9 @@ def document_upload(request):
                 elif document.google_sheets_url:
                     document.file_type = 'Google Sheets'
             document.save()
+            if document.file:
+                # Parsing large files is left to the background workers
+                enqueue('documents.process_upload', document_id=document.pk)
             
             log_audit(
                 request.user,
@@ -312,7 +416,130 @@ def document_upload(request):
     else:
         form = DocumentUploadForm()
     
-    return render(request, 'documents/document_upload.html', {'form': form})
+    return render(request, 'documents/document_upload.html', {
+        'form': form,
+        # Larger files are sent to an upload session in chunks
+        'chunked_upload_threshold': settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+        'upload_max_size': settings.UPLOAD_SESSION_MAX_SIZE,
+    })
+
+
+def _upload_session_json(session):
+    return {
+        'id': str(session.pk),
+        'filename': session.filename,
+        'size': session.size,
+        'offset': session.offset,
+        'chunk_size': settings.UPLOAD_SESSION_CHUNK_SIZE,
+        'expires_at': session.expires_at.isoformat(),
+        'upload_url': reverse('documents:upload_session', args=[session.pk]),
+        'complete_url': reverse('documents:upload_session_complete', args=[session.pk]),
+    }
+
+
+def _upload_error_response(exc):
+    return JsonResponse({'error': str(exc), 'offset': exc.offset}, status=exc.status)
+
+
+def _parse_content_range(header):
+    """Return ``(start, end, total)`` from a ``Content-Range: bytes a-b/n``
+    header, or None when it is malformed"""
+    units, _, spec = header.partition(' ')
+    byte_range, _, total = spec.partition('/')
+    start, _, end = byte_range.partition('-')
+    if units != 'bytes' or not (start.isdigit() and end.isdigit() and total.isdigit()):
+        return None
+    start, end, total = int(start), int(end), int(total)
+    if end < start:
+        return None
+    return start, end, total
+
+
+@login_required
+@require_POST
+def upload_session_create(request):
+    """Open a resumable upload session for a file too large for one request.
+
+    Takes the document's fields plus ``filename``, ``content_type`` and
+    ``size``; the client then PUTs ``chunk_size`` byte chunks to
+    ``upload_url`` and POSTs to ``complete_url``.
+    """
+    form = UploadSessionForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+    session = create_session(
+        request.user,
+        form.cleaned_data['filename'],
+        form.cleaned_data['content_type'],
+        form.cleaned_data['size'],
+        form.document_metadata(),
+    )
+    return JsonResponse(_upload_session_json(session), status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'PUT', 'DELETE'])
+def upload_session(request, session_id):
+    """Report (GET), extend with a chunk (PUT) or abandon (DELETE) an upload.
+
+    A chunk is the raw request body with a ``Content-Range: bytes
+    <first>-<last>/<size>`` header. When a chunk is rejected, or the
+    connection dropped before it was acknowledged, the client resumes from
+    the ``offset`` in the response or in a GET of the session.
+    """
+    session = get_object_or_404(UploadSession, pk=session_id, owner=request.user)
+
+    if request.method == 'DELETE':
+        delete_session(session)
+        return HttpResponse(status=204)
+
+    if request.method == 'PUT':
+        content_range = _parse_content_range(request.headers.get('Content-Range', ''))
+        if content_range is None or content_range[2] != session.size:
+            return JsonResponse(
+                {'error': 'A valid Content-Range header is required.', 'offset': session.offset},
+                status=400,
+            )
+        start, end, _total = content_range
+        try:
+            content_length = int(request.headers.get('Content-Length') or 0)
+        except ValueError:
+            content_length = 0
+        if content_length != end - start + 1:
+            return JsonResponse(
+                {'error': 'Content-Length does not match Content-Range.', 'offset': session.offset},
+                status=400,
+            )
+        try:
+            session = append_chunk(session, start, content_length, request)
+        except UploadError as exc:
+            return _upload_error_response(exc)
+
+    return JsonResponse(_upload_session_json(session))
+
+
+@login_required
+@require_POST
+def upload_session_complete(request, session_id):
+    """Create the document from a fully received upload session"""
+    session = get_object_or_404(UploadSession, pk=session_id, owner=request.user)
+    try:
+        document = complete_session(session, sha256=request.POST.get('sha256', ''))
+    except UploadError as exc:
+        return _upload_error_response(exc)
+
+    # Parsing large files is left to the background workers
+    enqueue('documents.process_upload', document_id=document.pk)
+    log_audit(
+        request.user,
+        'DOCUMENT_UPLOAD',
+        f'Uploaded document: {document.title}',
+        request
+    )
+    return JsonResponse({
+        'id': document.pk,
+        'url': reverse('documents:document_detail', args=[document.pk]),
+    }, status=201)
 
 
 @login_required
@@ -347,6 +574,7 @@ def document_detail(request, pk):
         'preview_char_limit': PREVIEW_CHAR_LIMIT,
         'preview_row_limit': PREVIEW_ROW_LIMIT,
         'preview_column_limit': PREVIEW_COLUMN_LIMIT,
+        'pdf_preview_page_limit': PDF_PREVIEW_PAGE_LIMIT,
     }
 
     if document.file:
@@ -357,7 +585,8 @@ def document_detail(request, pk):
                 preview_context['preview_error'] = 'Preview is unavailable for this file.'
                 return _render_document_detail(request, document, preview_type, preview_context)
             file_size = document.file_size or document.file.size
-            if file_size > PREVIEW_MAX_FILE_SIZE:
+            # PDF pages are served one at a time, so large PDFs still preview
+            if file_size > PREVIEW_MAX_FILE_SIZE and file_extension != '.pdf':
                 preview_type = 'unsupported'
                 preview_context['preview_error'] = (
                     'Preview is available for files up to 5 MB. Please download to view.'
@@ -366,41 +595,30 @@ def document_detail(request, pk):
             try:
                 if file_extension == '.pdf':
                     preview_type = 'pdf'
+                    preview_context['pdf_page_images'] = pdf_renderer() is not None
+                    if file_size <= PREVIEW_MAX_FILE_SIZE:
+                        preview = get_document_preview(document)
+                        preview_context.update({
+                            'preview_text': preview.text,
+                            'preview_truncated': preview.truncated,
+                            'preview_error': preview.error,
+                        })
                 elif file_extension in ('.jpg', '.jpeg', '.png'):
                     preview_type = 'image'
-                elif file_extension in ('.txt', '.csv', '.log'):
-                    preview_type = 'text'
-                    preview_text, preview_truncated = _load_text_preview(document.file.path)
-                    preview_context.update({
-                        'preview_text': preview_text,
-                        'preview_truncated': preview_truncated,
-                    })
-                elif file_extension == '.docx':
-                    preview_type = 'text'
-                    preview_text, preview_truncated = _load_docx_preview(document.file.path)
+                elif file_extension in STORED_PREVIEW_EXTENSIONS:
+                    preview = get_document_preview(document)
+                    preview_type = preview.preview_type
                     preview_context.update({
-                        'preview_text': preview_text,
-                        'preview_truncated': preview_truncated,
-                    })
-                elif file_extension == '.xlsx':
-                    preview_type = 'spreadsheet'
-                    sheet_name, preview_rows, preview_truncated = _load_spreadsheet_preview(
-                        document.file.path
-                    )
-                    preview_context.update({
-                        'preview_sheet_name': sheet_name,
-                        'preview_rows': preview_rows,
-                        'preview_truncated': preview_truncated,
+                        'preview_text': preview.text,
+                        'preview_rows': preview.rows,
+                        'preview_sheet_name': preview.sheet_name,
+                        'preview_truncated': preview.truncated,
+                        'preview_error': preview.error,
                     })
                 elif file_extension in ('.doc', '.xls'):
                     preview_type = 'office'
                 else:
                     preview_type = 'unsupported'
-            except PreviewError:
-                preview_type = 'unsupported'
-                preview_context['preview_error'] = (
-                    'Preview could not be generated because the file contents could not be read.'
-                )
             except OSError:
                 preview_type = 'unsupported'
                 preview_context['preview_error'] = (
@@ -446,14 +664,190 @@ def document_preview(request, pk):
         return redirect('documents:document_detail', pk=pk)
 
     if os.path.exists(document.file.path):
-        response = FileResponse(document.file.open('rb'), content_type=document.file_type)
-        filename = quote(os.path.basename(document.file.name))
-        response['Content-Disposition'] = f'inline; filename="{filename}"'
-        return response
+        return serve_file(
+            request,
+            document.file.path,
+            _file_etag(document),
+            content_type=document.file_type,
+            filename=document.filename,
+        )
 
     raise Http404("Document file not found")
 
 
+@login_required
+def document_thumbnail(request, pk, size):
+    """Serve a thumbnail of an image or PDF document.
+
+    Thumbnails are keyed by the file's hash, so the hash is a strong ETag.
+    Pages link to them with ``?v=<file hash>``; such a versioned URL never
+    changes content and may be cached for a year.
+    """
+    document = get_object_or_404(Document, pk=pk)
+
+    if document.is_archived:
+        raise Http404('Document is archived')
+
+    if not can_access_document(request.user, document):
+        raise PermissionDenied
+
+    if size not in THUMBNAIL_SIZES or not document.has_thumbnail:
+        raise Http404('Thumbnail is not available for this document')
+
+    if not os.path.exists(document.file.path) or not _is_safe_media_path(document.file.path):
+        raise Http404('Document file not found')
+
+    file_hash = document.file_hash or refresh_file_hash(document)
+    etag = f'"{file_hash}-{size}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        try:
+            path = get_thumbnail(document.file.path, document.get_file_extension(), file_hash, size)
+        except ThumbnailError:
+            raise Http404('Thumbnail could not be generated')
+        response = FileResponse(open(path, 'rb'), content_type=THUMBNAIL_CONTENT_TYPE)
+
+    response['ETag'] = etag
+    if request.GET.get('v') == file_hash:
+        response['Cache-Control'] = f'private, max-age={THUMBNAIL_CACHE_SECONDS}, immutable'
+    else:
+        response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@login_required
+def document_spreadsheet_window(request, pk):
+    """Return a window of rows and columns from any sheet of a spreadsheet as JSON.
+
+    Query parameters are ``sheet``, ``row`` and ``col`` (1-based) and
+    ``rows`` and ``cols`` (window size). The detail page fetches windows as
+    the user scrolls instead of rendering the whole workbook.
+    """
+    document = get_object_or_404(Document, pk=pk)
+
+    if document.is_archived:
+        raise Http404('Document is archived')
+
+    if not can_access_document(request.user, document):
+        raise PermissionDenied
+
+    if document.get_file_extension() != '.xlsx':
+        raise Http404('Document is not a spreadsheet')
+
+    if not os.path.exists(document.file.path) or not _is_safe_media_path(document.file.path):
+        raise Http404('Document file not found')
+
+    if (document.file_size or document.file.size) > PREVIEW_MAX_FILE_SIZE:
+        raise Http404('Preview is unavailable for this file')
+
+    try:
+        first_row = int(request.GET.get('row', 1))
+        row_count = int(request.GET.get('rows', PREVIEW_ROW_LIMIT))
+        first_column = int(request.GET.get('col', 1))
+        column_count = int(request.GET.get('cols', PREVIEW_COLUMN_LIMIT))
+    except ValueError:
+        return HttpResponseBadRequest('Invalid spreadsheet window')
+
+    file_hash = document.file_hash or refresh_file_hash(document)
+    sheet_name = request.GET.get('sheet', '')
+    etag = f'"{file_hash}-{quote(sheet_name)}-{first_row}-{row_count}-{first_column}-{column_count}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        try:
+            window = preview_cache.get_or_render(
+                ('window', file_hash, sheet_name, first_row, row_count, first_column, column_count),
+                lambda: run_sandboxed(
+                    load_spreadsheet_window,
+                    document.file.path,
+                    sheet_name=sheet_name or None,
+                    first_row=first_row,
+                    row_count=row_count,
+                    first_column=first_column,
+                    column_count=column_count,
+                ),
+            )
+        except PreviewError as exc:
+            if exc.reason == PreviewError.BUSY:
+                response = JsonResponse({'error': str(exc)}, status=503)
+                response['Retry-After'] = str(PREVIEW_RETRY_SECONDS)
+                return response
+            return JsonResponse({'error': str(exc)}, status=422)
+        if window['sheet'] is None:
+            return JsonResponse({'error': 'Sheet not found.', 'sheets': window['sheets']}, status=404)
+        response = JsonResponse(window)
+
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@login_required
+def document_pdf_page(request, pk):
+    """Serve one page of a PDF document as JSON text or as a rendered image.
+
+    ``?page=`` is 1-based. ``?format=image`` returns the page rasterized
+    when a PDF renderer is installed; otherwise the page's text and the
+    document's page count are returned as JSON. Both are cached per file
+    version, and image URLs carrying ``?v=<file hash>`` are immutable.
+    """
+    document = get_object_or_404(Document, pk=pk)
+
+    if document.is_archived:
+        raise Http404('Document is archived')
+
+    if not can_access_document(request.user, document):
+        raise PermissionDenied
+
+    if document.get_file_extension() != '.pdf':
+        raise Http404('Document is not a PDF')
+
+    if not os.path.exists(document.file.path) or not _is_safe_media_path(document.file.path):
+        raise Http404('Document file not found')
+
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        return HttpResponseBadRequest('Invalid page')
+    as_image = request.GET.get('format') == 'image'
+    if as_image and pdf_renderer() is None:
+        raise Http404('Page images are not available')
+
+    file_hash = document.file_hash or refresh_file_hash(document)
+    etag = f'"{file_hash}-p{page}-{"image" if as_image else "text"}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        if as_image:
+            try:
+                path = get_pdf_page_image(document.file.path, file_hash, page)
+            except ThumbnailError:
+                raise Http404('Page could not be rendered')
+            response = FileResponse(open(path, 'rb'), content_type=THUMBNAIL_CONTENT_TYPE)
+        else:
+            try:
+                result = preview_cache.get_or_render(
+                    ('pdf-page', file_hash, page),
+                    lambda: run_sandboxed(load_pdf_page, document.file.path, page),
+                )
+            except PreviewError as exc:
+                if exc.reason == PreviewError.BUSY:
+                    response = JsonResponse({'error': str(exc)}, status=503)
+                    response['Retry-After'] = str(PREVIEW_RETRY_SECONDS)
+                    return response
+                return JsonResponse({'error': str(exc)}, status=422)
+            if result['page'] is None:
+                return JsonResponse(
+                    {'error': 'Page not found.', 'page_count': result['page_count']}, status=404
+                )
+            response = JsonResponse(result)
+
+    response['ETag'] = etag
+    if as_image and request.GET.get('v') == file_hash:
+        response['Cache-Control'] = f'private, max-age={THUMBNAIL_CACHE_SECONDS}, immutable'
+    else:
+        response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 @login_required
 def document_download(request, pk):
     """Download a document"""
@@ -472,20 +866,80 @@ def document_download(request, pk):
     if not document.file:
         messages.error(request, 'This document does not have a file to download.')
         return redirect('documents:document_detail', pk=pk)
-    
+
+    if not os.path.exists(document.file.path):
+        raise Http404("Document file not found")
+
+    response = serve_file(
+        request,
+        document.file.path,
+        _file_etag(document),
+        as_attachment=True,
+        filename=document.filename,
+    )
+    # Revalidations and refused ranges transfer nothing worth auditing
+    if response.status_code in (200, 206):
+        log_audit(
+            request.user,
+            'DOCUMENT_DOWNLOAD',
+            f'Downloaded document: {document.title}',
+            request
+        )
+    return response
+
+
+@login_required
+def document_bulk_download(request):
+    """Download a folder, or a list of documents, as one ZIP archive.
+
+    Takes a folder key as ``folder`` or document ids as ``ids``, repeated
+    or comma-separated. Access is checked for all documents in one query;
+    documents the user cannot access, archived ones and links without a
+    file are left out. The archive is streamed as it is built and the
+    download is audited once.
+    """
+    folder_key = request.GET.get('folder', '').strip()
+    raw_ids = [
+        part.strip() for value in request.GET.getlist('ids') for part in value.split(',') if part.strip()
+    ]
+    if bool(folder_key) == bool(raw_ids):
+        return HttpResponseBadRequest('Give either a folder or document ids.')
+
+    documents = (
+        _accessible_documents(request.user)
+        .select_related('blob')
+        .exclude(file='')
+        .exclude(file__isnull=True)
+    )
+    if folder_key:
+        folder = get_object_or_404(DocumentFolder, key=folder_key)
+        documents = documents.filter(section=folder.key)
+        filename = f'{folder.name}.zip'
+        source = f'folder {folder.name}'
+    else:
+        try:
+            ids = {int(value) for value in raw_ids}
+        except ValueError:
+            return HttpResponseBadRequest('Invalid document ids.')
+        documents = documents.filter(pk__in=ids)
+        filename = 'documents.zip'
+        source = 'selection'
+    documents = list(documents.order_by('title', 'pk'))
+
+    if not documents:
+        messages.info(request, 'There are no documents you can download here.')
+        return redirect('documents:document_list')
+
     log_audit(
         request.user,
-        'DOCUMENT_DOWNLOAD',
-        f'Downloaded document: {document.title}',
+        'DOCUMENT_BULK_DOWNLOAD',
+        f'Downloaded {len(documents)} documents from {source} as a ZIP archive: '
+        + ', '.join(str(document.pk) for document in documents),
         request
     )
-    
-    # Serve file
-    if os.path.exists(document.file.path):
-        response = FileResponse(document.file.open('rb'), as_attachment=True)
-        return response
-    else:
-        raise Http404("Document file not found")
+    response = StreamingHttpResponse(stream_zip(documents), content_type='application/zip')
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
 
 
 @login_required
@@ -499,7 +953,7 @@ def document_update(request, pk):
         return redirect('documents:document_list')
     
     # Only owner, manager, or admin can update
-    if not (document.owner == request.user or request.user.is_president or request.user.is_adviser):
+    if not (document.owner_id == request.user.pk or request.user.has_capability(Role.MANAGE_DOCUMENTS)):
         messages.error(request, 'You do not have permission to update this document.')
         return redirect('documents:document_detail', pk=pk)
     
@@ -533,7 +987,7 @@ def document_delete(request, pk):
     document = get_object_or_404(Document, pk=pk)
     
     # Only owner, manager, or admin can archive
-    if not (document.owner == request.user or request.user.is_president or request.user.is_adviser):
+    if not (document.owner_id == request.user.pk or request.user.has_capability(Role.MANAGE_DOCUMENTS)):
         messages.error(request, 'You do not have permission to archive this document.')
         return redirect('documents:document_detail', pk=pk)
     
@@ -0,0 +1,102 @@
+import logging
+import os
+import signal
+import socket
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+
+from jobs.queue import DEFAULT_VISIBILITY_TIMEOUT, work_once
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Run background job workers that poll the job table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=2,
+            help='Number of worker threads (default: 2)',
+        )
+        parser.add_argument(
+            '--visibility-timeout',
+            type=int,
+            default=DEFAULT_VISIBILITY_TIMEOUT,
+            help='Seconds a claimed job stays leased before another worker may retry it',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait between polls when no job is runnable',
+        )
+        parser.add_argument(
+            '--drain',
+            action='store_true',
+            help='Exit once no job is runnable instead of polling forever',
+        )
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        if concurrency < 1:
+            raise CommandError('--concurrency must be at least 1.')
+
+        stop = threading.Event()
+        self.processed = 0
+        self.lock = threading.Lock()
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+
+        if concurrency == 1:
+            self._work(f'{prefix}:0', stop, options)
+        else:
+            if threading.current_thread() is threading.main_thread():
+                signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+            threads = [
+                threading.Thread(target=self._run_thread, args=(f'{prefix}:{index}', stop, options))
+                for index in range(concurrency)
+            ]
+            for thread in threads:
+                thread.start()
+            try:
+                while any(thread.is_alive() for thread in threads):
+                    for thread in threads:
+                        thread.join(timeout=1)
+            except KeyboardInterrupt:
+                stop.set()
+                for thread in threads:
+                    thread.join()
+
+        self.stdout.write(self.style.SUCCESS(f'Workers stopped after {self.processed} jobs'))
+
+    def _run_thread(self, worker_id, stop, options):
+        try:
+            self._work(worker_id, stop, options)
+        finally:
+            # Each thread holds its own database connection
+            connection.close()
+
+    def _work(self, worker_id, stop, options):
+        while not stop.is_set():
+            try:
+                job = work_once(worker_id, options['visibility_timeout'])
+            except DatabaseError:
+                # Drop the connection and keep polling; a job claimed before
+                # the error is retried once its lease expires.
+                logger.exception('Worker %s lost its database connection', worker_id)
+                connection.close()
+                stop.wait(options['poll_interval'])
+                continue
+            if job is None:
+                if options['drain']:
+                    return
+                stop.wait(options['poll_interval'])
+                continue
+            with self.lock:
+                self.processed += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{worker_id}: {job.name} #{job.pk} {job.status.lower()}')
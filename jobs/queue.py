@@ -0,0 +1,141 @@
+"""Database-backed background job queue.
+
+Jobs are rows in ``Job`` claimed with ``SELECT ... FOR UPDATE SKIP LOCKED``,
+so any number of worker threads and processes can poll the table without
+handing out the same job twice. A claimed job is leased for a visibility
+timeout; if its worker dies the lease expires and another worker claims the
+job again. Failed attempts are retried with exponential backoff until the
+task's ``max_attempts`` is reached.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_VISIBILITY_TIMEOUT = 300  # seconds
+RETRY_BACKOFF_BASE = 30  # seconds before the first retry
+RETRY_BACKOFF_MAX = 60 * 60
+
+_registry = {}
+
+
+class UnknownTask(Exception):
+    """Raised when a job names a task that is not registered."""
+
+
+def task(name, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Register a function as a background task under ``name``"""
+    def decorator(func):
+        func.task_name = name
+        func.max_attempts = max_attempts
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def get_task(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise UnknownTask(name) from None
+
+
+def enqueue(name, run_after=None, **kwargs):
+    """Queue task ``name`` to run in a worker with JSON-serializable ``kwargs``"""
+    func = get_task(name)
+    return Job.objects.create(
+        name=name,
+        kwargs=kwargs,
+        max_attempts=func.max_attempts,
+        run_after=run_after or timezone.now(),
+    )
+
+
+def retry_delay(attempts):
+    """Return the backoff before retrying a job that failed ``attempts`` times"""
+    return timedelta(seconds=min(RETRY_BACKOFF_BASE * 2 ** (attempts - 1), RETRY_BACKOFF_MAX))
+
+
+def claim_job(worker_id, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+    """Lease the next runnable job to ``worker_id``, or return None.
+
+    Runnable jobs are queued jobs that are due and running jobs whose lease
+    has expired. A job whose lease expired on its final attempt is failed
+    instead of being run again.
+    """
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            job = (
+                Job.objects.select_for_update(skip_locked=True)
+                .filter(
+                    Q(status=Job.QUEUED, run_after__lte=now)
+                    | Q(status=Job.RUNNING, locked_until__lt=now)
+                )
+                .order_by('run_after', 'pk')
+                .first()
+            )
+            if job is None:
+                return None
+
+            if job.status == Job.RUNNING and job.attempts >= job.max_attempts:
+                job.status = Job.FAILED
+                job.finished_at = now
+                job.locked_by = ''
+                job.locked_until = None
+                job.last_error = 'Visibility timeout expired on the final attempt.'
+                job.save(update_fields=['status', 'finished_at', 'locked_by', 'locked_until', 'last_error'])
+                continue
+
+            job.status = Job.RUNNING
+            job.attempts += 1
+            job.locked_by = worker_id
+            job.locked_until = now + timedelta(seconds=visibility_timeout)
+            job.started_at = now
+            job.save(update_fields=['status', 'attempts', 'locked_by', 'locked_until', 'started_at'])
+            return job
+
+
+def run_job(job, worker_id):
+    """Run a claimed job and record the outcome.
+
+    The outcome is only written while ``worker_id`` still holds the lease, so
+    a job that outlived its visibility timeout and was claimed by another
+    worker is left to that worker.
+    """
+    try:
+        get_task(job.name)(**job.kwargs)
+    except Exception as exc:
+        logger.exception('Job %s (%s) failed on attempt %s', job.pk, job.name, job.attempts)
+        now = timezone.now()
+        updates = {'last_error': traceback.format_exc()}
+        if isinstance(exc, UnknownTask) or job.attempts >= job.max_attempts:
+            updates.update(status=Job.FAILED, finished_at=now)
+        else:
+            updates.update(status=Job.QUEUED, run_after=now + retry_delay(job.attempts))
+    else:
+        now = timezone.now()
+        updates = {'status': Job.SUCCEEDED, 'finished_at': now, 'last_error': ''}
+
+    updates.update(locked_by='', locked_until=None)
+    Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=worker_id).update(**updates)
+    for field, value in updates.items():
+        setattr(job, field, value)
+    return job
+
+
+def work_once(worker_id, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+    """Claim and run one job; return it, or None when nothing is runnable"""
+    job = claim_job(worker_id, visibility_timeout)
+    if job is None:
+        return None
+    return run_job(job, worker_id)
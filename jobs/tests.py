@@ -0,0 +1,137 @@
+import io
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User, Role
+from .models import Job
+from .queue import claim_job, enqueue, retry_delay, run_job, task, work_once
+
+
+calls = []
+
+
+@task('jobs.tests.record', max_attempts=2)
+def record(value):
+    calls.append(value)
+
+
+@task('jobs.tests.explode', max_attempts=2)
+def explode():
+    raise RuntimeError('boom')
+
+
+class JobQueueTests(TestCase):
+    """Test claiming, running and retrying jobs"""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueued_job_runs_once(self):
+        job = enqueue('jobs.tests.record', value='hello')
+
+        self.assertEqual(work_once('worker-1').pk, job.pk)
+        self.assertIsNone(work_once('worker-1'))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(calls, ['hello'])
+
+    def test_future_job_is_not_claimed(self):
+        enqueue('jobs.tests.record', run_after=timezone.now() + timedelta(hours=1), value='later')
+        self.assertIsNone(claim_job('worker-1'))
+
+    def test_failed_job_is_retried_with_backoff_then_failed(self):
+        job = enqueue('jobs.tests.explode')
+
+        before = timezone.now()
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            work_once('worker-1')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn('boom', job.last_error)
+        self.assertGreaterEqual(job.run_after, before + retry_delay(1))
+        self.assertIsNone(claim_job('worker-1'))
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            work_once('worker-1')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_expired_lease_is_reclaimed_by_another_worker(self):
+        job = enqueue('jobs.tests.record', value='lost')
+        stale = claim_job('worker-1', visibility_timeout=60)
+        self.assertIsNone(claim_job('worker-2'))
+
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        reclaimed = claim_job('worker-2')
+        self.assertEqual(reclaimed.pk, job.pk)
+        self.assertEqual(reclaimed.attempts, 2)
+
+        # The first worker lost its lease and cannot record an outcome
+        run_job(stale, 'worker-1')
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.RUNNING)
+        run_job(reclaimed, 'worker-2')
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.SUCCEEDED)
+
+    def test_expired_lease_on_final_attempt_fails_the_job(self):
+        job = enqueue('jobs.tests.record', value='lost')
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.RUNNING,
+            attempts=2,
+            locked_until=timezone.now() - timedelta(seconds=1),
+        )
+
+        self.assertIsNone(claim_job('worker-1'))
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.FAILED)
+        self.assertEqual(calls, [])
+
+    def test_run_workers_drains_the_queue(self):
+        for value in range(3):
+            enqueue('jobs.tests.record', value=value)
+
+        out = io.StringIO()
+        call_command('run_workers', concurrency=1, drain=True, stdout=out)
+
+        self.assertEqual(calls, [0, 1, 2])
+        self.assertIn('3 jobs', out.getvalue())
+
+
+class JobStatusViewTests(TestCase):
+    """Test the job status page"""
+
+    def setUp(self):
+        self.client = Client()
+        self.adviser = User.objects.create_user(
+            username='jobs_adviser',
+            password='pass',
+            role=Role.objects.create(name=Role.ADVISER)
+        )
+        self.officer = User.objects.create_user(
+            username='jobs_officer',
+            password='pass',
+            role=Role.objects.create(name=Role.AUDITOR)
+        )
+
+    def test_adviser_sees_jobs(self):
+        enqueue('jobs.tests.record', value='shown')
+        self.client.login(username='jobs_adviser', password='pass')
+        response = self.client.get(reverse('jobs:job_list'), {'status': Job.QUEUED})
+        self.assertContains(response, 'jobs.tests.record')
+
+    def test_adviser_sees_preview_cache_counters(self):
+        self.client.login(username='jobs_adviser', password='pass')
+        response = self.client.get(reverse('jobs:job_list'))
+        self.assertContains(response, 'Preview Cache')
+        self.assertIn('misses', response.context['preview_cache_stats'])
+
+    def test_officer_cannot_see_jobs(self):
+        self.client.login(username='jobs_officer', password='pass')
+        response = self.client.get(reverse('jobs:job_list'))
+        self.assertRedirects(response, reverse('dashboard:index'))
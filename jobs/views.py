@@ -0,0 +1,41 @@
+from django.contrib.auth.decorators import login_required
+from django.db.models import Count
+from django.shortcuts import render
+
+from accounts.decorators import admin_required
+from documents.preview_cache import preview_cache
+from documents.sandbox import sandbox_stats
+from .models import Job
+
+
+JOB_LIST_LIMIT = 200
+
+
+@login_required
+@admin_required
+def job_list(request):
+    """Background job status (admin only)"""
+    jobs = Job.objects.all()
+
+    status = request.GET.get('status')
+    if status:
+        jobs = jobs.filter(status=status)
+
+    name = request.GET.get('name')
+    if name:
+        jobs = jobs.filter(name=name)
+
+    counts = dict(Job.objects.values_list('status').annotate(count=Count('pk')).order_by())
+    status_counts = [
+        (value, label, counts.get(value, 0))
+        for value, label in Job.STATUS_CHOICES
+    ]
+
+    return render(request, 'jobs/job_list.html', {
+        'jobs': jobs[:JOB_LIST_LIMIT],
+        'job_list_limit': JOB_LIST_LIMIT,
+        'status_counts': status_counts,
+        'status_choices': Job.STATUS_CHOICES,
+        'sandbox_stats': sandbox_stats(),
+        'preview_cache_stats': preview_cache.stats(),
+    })
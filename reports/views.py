@@ -3,19 +3,19 @@ from django.contrib.auth.decorators import login_required
 from django.http import HttpResponse
 from documents.models import Document
 from documents.permissions import get_accessible_documents
-from accounts.models import AuditLog
-from accounts.decorators import manager_or_admin_required
+from accounts.models import AuditLog, Role
+from accounts.decorators import capability_required
 import csv
 from datetime import datetime
 
 
 @login_required
-@manager_or_admin_required
+@capability_required(Role.VIEW_REPORTS)
 def document_inventory(request):
     """Document inventory report"""
     documents = Document.objects.filter(
         get_accessible_documents(request.user)
-    ).select_related('owner').distinct()
+    ).select_related('owner')
     
     # Apply filters
     classification = request.GET.get('classification')
@@ -35,7 +35,7 @@ def document_inventory(request):
 
 
 @login_required
-@manager_or_admin_required
+@capability_required(Role.VIEW_REPORTS)
 def activity_report(request):
     """Activity report"""
     logs = AuditLog.objects.select_related('user').order_by('-timestamp')
@@ -69,12 +69,12 @@ def activity_report(request):
 
 
 @login_required
-@manager_or_admin_required
+@capability_required(Role.VIEW_REPORTS)
 def export_inventory_csv(request):
     """Export document inventory to CSV"""
     documents = Document.objects.filter(
         get_accessible_documents(request.user)
-    ).select_related('owner').distinct()
+    ).select_related('owner')
     
     # Apply filters
     classification = request.GET.get('classification')
@@ -108,7 +108,7 @@ def export_inventory_csv(request):
 
 
 @login_required
-@manager_or_admin_required
+@capability_required(Role.VIEW_REPORTS)
 def export_activity_csv(request):
     """Export activity report to CSV"""
     logs = AuditLog.objects.select_related('user').order_by('-timestamp')
@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     
     # Third party apps
     'rest_framework',
@@ -50,6 +51,7 @@ INSTALLED_APPS = [
     'documents',
     'dashboard',
     'reports',
+    'jobs',
 ]
 
 # Crispy forms settings
@@ -153,6 +155,12 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Authentication
 AUTH_USER_MODEL = 'accounts.User'
+# ModelBackend stays listed so sessions created before RoleModelBackend
+# keep resolving; those users move to it when they next log in
+AUTHENTICATION_BACKENDS = [
+    'accounts.backends.RoleModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
 LOGIN_URL = 'accounts:login'
 LOGIN_REDIRECT_URL = 'dashboard:index'
 LOGOUT_REDIRECT_URL = 'accounts:login'
@@ -174,8 +182,20 @@ SECURE_CONTENT_TYPE_NOSNIFF = True
 X_FRAME_OPTIONS = 'DENY'
 
 # File upload settings
+# Uploads are type-checked, sized and hashed while they stream in
+FILE_UPLOAD_HANDLERS = [
+    'documents.uploads.CheckedMemoryFileUploadHandler',
+    'documents.uploads.CheckedTemporaryFileUploadHandler',
+]
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
+# Resumable uploads: files larger than a single request allows are sent in
+# fixed-size chunks to an upload session, kept in UPLOAD_SESSION_DIR until
+# completed or abandoned for UPLOAD_SESSION_EXPIRY seconds
+UPLOAD_SESSION_DIR = config('UPLOAD_SESSION_DIR', default=str(BASE_DIR / 'tmp' / 'uploads'))
+UPLOAD_SESSION_CHUNK_SIZE = config('UPLOAD_SESSION_CHUNK_SIZE', default=8388608, cast=int)  # 8MB
+UPLOAD_SESSION_MAX_SIZE = config('UPLOAD_SESSION_MAX_SIZE', default=524288000, cast=int)  # 500MB
+UPLOAD_SESSION_EXPIRY = config('UPLOAD_SESSION_EXPIRY', default=24 * 60 * 60, cast=int)
 ALLOWED_DOCUMENT_TYPES = [
     'application/pdf',
     'application/msword',
@@ -187,6 +207,49 @@ ALLOWED_DOCUMENT_TYPES = [
     'image/png',
 ]
 
+# File delivery: 'django' streams document files from the web process;
+# 'x-accel-redirect' (nginx) and 'x-sendfile' (Apache, lighttpd) hand them
+# to the front proxy after the permission check. For nginx, map the prefix
+# to MEDIA_ROOT in an ``internal`` location.
+FILE_DELIVERY_MODE = config('FILE_DELIVERY_MODE', default='django')
+FILE_DELIVERY_ACCEL_PREFIX = config('FILE_DELIVERY_ACCEL_PREFIX', default='/protected-media/')
+
+# Compression at rest: comma-separated "content/type=encoding" pairs with
+# gzip or zstd (needs the zstandard package) as the encoding, for
+# text/plain, application/msword and application/vnd.ms-excel. Empty
+# stores every file as uploaded.
+DOCUMENT_COMPRESSION = {
+    content_type.strip(): encoding.strip()
+    for content_type, _, encoding in (
+        pair.partition('=') for pair in config('DOCUMENT_COMPRESSION', default='', cast=Csv())
+    )
+}
+
+# File parser sandbox: previews and text extraction parse files in this
+# many worker processes per web/job process (0 parses inline, unsandboxed)
+PREVIEW_SANDBOX_WORKERS = config('PREVIEW_SANDBOX_WORKERS', default=2, cast=int)
+PREVIEW_SANDBOX_TIMEOUT = config('PREVIEW_SANDBOX_TIMEOUT', default=15, cast=int)  # seconds
+PREVIEW_SANDBOX_MEMORY_LIMIT = config('PREVIEW_SANDBOX_MEMORY_LIMIT', default=536870912, cast=int)  # 512MB
+PREVIEW_SANDBOX_TASKS_PER_WORKER = config('PREVIEW_SANDBOX_TASKS_PER_WORKER', default=100, cast=int)
+
+# Preview cache: an in-process LRU per process in front of the shared
+# ``previews`` cache, which is on disk by default
+PREVIEW_CACHE_MEMORY_BYTES = config('PREVIEW_CACHE_MEMORY_BYTES', default=16777216, cast=int)  # 16MB
+PREVIEW_CACHE_MAX_ENTRY_BYTES = config('PREVIEW_CACHE_MAX_ENTRY_BYTES', default=1048576, cast=int)  # 1MB
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'previews': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('PREVIEW_CACHE_DIR', default=str(BASE_DIR / 'cache' / 'previews')),
+        'TIMEOUT': config('PREVIEW_CACHE_TIMEOUT', default=7 * 24 * 60 * 60, cast=int),  # 1 week
+        'OPTIONS': {
+            'MAX_ENTRIES': config('PREVIEW_CACHE_MAX_ENTRIES', default=5000, cast=int),
+        },
+    },
+}
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -27,6 +27,7 @@ urlpatterns = [
     path('dashboard/', include('dashboard.urls')),
     path('documents/', include('documents.urls')),
     path('reports/', include('reports.urls')),
+    path('jobs/', include('jobs.urls')),
 ]
 
 # Serve media files in development